@@ -5,10 +5,15 @@ from frappe.auth import LoginManager
 from frappe.sessions import Session
 from werkzeug.security import check_password_hash, generate_password_hash
 import json
+import orjson
 import hashlib
+import hmac
 import secrets
+import time
 import jwt
+import numpy as np
 from datetime import datetime, timedelta
+from collections import defaultdict
 
 # JWT Configuration
 JWT_SECRET_KEY = "your-super-secret-jwt-key-change-in-production"
@@ -40,6 +45,55 @@ def verify_jwt_token(token):
 # AUTHENTICATION & AUTHORIZATION APIs
 # ============================================================================
 
+# Role hierarchy (higher roles include lower role permissions)
+ROLE_HIERARCHY = {
+    "Restaurant Owner": frozenset({"Restaurant Manager", "Restaurant Staff", "Restaurant Kitchen", "Restaurant Cashier"}),
+    "Restaurant Manager": frozenset({"Restaurant Staff", "Restaurant Kitchen", "Restaurant Cashier"}),
+    "Restaurant Kitchen": frozenset(),
+    "Restaurant Staff": frozenset(),
+    "Restaurant Cashier": frozenset()
+}
+
+def build_role_closure(hierarchy):
+    """Map each role to every role it covers, itself included"""
+    closure = {}
+    for role in hierarchy:
+        covered = {role}
+        pending = list(hierarchy[role])
+        while pending:
+            lower_role = pending.pop()
+            if lower_role not in covered:
+                covered.add(lower_role)
+                pending.extend(hierarchy.get(lower_role, ()))
+        closure[role] = frozenset(covered)
+    return closure
+
+ROLE_CLOSURE = build_role_closure(ROLE_HIERARCHY)
+
+# Staff position -> Frappe role assigned at registration
+POSITION_ROLES = {
+    "Owner": "Restaurant Owner",
+    "Manager": "Restaurant Manager",
+    "Assistant Manager": "Restaurant Manager",
+    "Waiter": "Restaurant Staff",
+    "Waitress": "Restaurant Staff",
+    "Server": "Restaurant Staff",
+    "Chef": "Restaurant Kitchen",
+    "Sous Chef": "Restaurant Kitchen",
+    "Cook": "Restaurant Kitchen",
+    "Kitchen Staff": "Restaurant Kitchen",
+    "Prep Cook": "Restaurant Kitchen",
+    "Cashier": "Restaurant Cashier",
+    "Host": "Restaurant Staff",
+    "Hostess": "Restaurant Staff",
+    "Bartender": "Restaurant Staff",
+    "Dishwasher": "Restaurant Staff",
+    "Busser": "Restaurant Staff"
+}
+
+# Fields register_staff cannot do without
+REGISTER_STAFF_REQUIRED_FIELDS = ("full_name", "email", "position", "department", "hire_date", "base_hourly_rate")
+
 def get_current_user():
     """Get current authenticated user"""
     # Try to get from request context first (JWT auth)
@@ -49,6 +103,17 @@ def get_current_user():
     # Fall back to Frappe session
     return frappe.session.user
 
+def get_user_roles(user):
+    """Get a user's roles as a frozenset, looked up once per request"""
+    user_roles = getattr(frappe.local, "restaurant_user_roles", None)
+    if user_roles is None:
+        user_roles = frappe.local.restaurant_user_roles = {}
+    
+    roles = user_roles.get(user)
+    if roles is None:
+        roles = user_roles[user] = frozenset(frappe.get_roles(user))
+    return roles
+
 def has_permission(role_required, user=None):
     """Check if user has required role"""
     if not user:
@@ -57,25 +122,14 @@ def has_permission(role_required, user=None):
     if user == "Administrator":
         return True
     
-    user_roles = frappe.get_roles(user)
-    
-    # Role hierarchy (higher roles include lower role permissions)
-    role_hierarchy = {
-        "Restaurant Owner": ["Restaurant Manager", "Restaurant Staff", "Restaurant Kitchen", "Restaurant Cashier"],
-        "Restaurant Manager": ["Restaurant Staff", "Restaurant Kitchen", "Restaurant Cashier"],
-        "Restaurant Kitchen": [],
-        "Restaurant Staff": [],
-        "Restaurant Cashier": []
-    }
+    user_roles = get_user_roles(user)
     
-    # Check if user has the required role or a higher role
-    for user_role in user_roles:
-        if user_role == role_required:
-            return True
-        if user_role in role_hierarchy and role_required in role_hierarchy[user_role]:
-            return True
+    # Most callers hold the required role itself
+    if role_required in user_roles:
+        return True
     
-    return False
+    # Otherwise check for a higher role that includes it
+    return any(role_required in ROLE_CLOSURE.get(user_role, ()) for user_role in user_roles)
 
 def require_auth(role_required=None):
     """Decorator to require authentication and optional role"""
@@ -108,10 +162,7 @@ def login():
             }
         
         # Check if user exists and is staff member
-        staff = frappe.db.get_value("Restaurant Staff", 
-            {"email": email, "employment_status": "Active"}, 
-            ["name", "full_name", "position", "department", "email"]
-        )
+        staff = get_login_staff(email)
         
         if not staff:
             return {
@@ -124,8 +175,8 @@ def login():
         login_manager.authenticate(email, password)
         
         if login_manager.user:
-            # Get user roles and staff info
-            user_roles = frappe.get_roles(email)
+            # Roles are looked up per login so role changes on the User show up immediately
+            user_roles = list(get_user_roles(email))
             
             # Generate JWT token
             token = generate_jwt_token(email)
@@ -135,9 +186,9 @@ def login():
                 "message": "Login successful",
                 "data": {
                     "user": email,
-                    "full_name": staff[1],
-                    "position": staff[2],
-                    "department": staff[3],
+                    "full_name": staff.full_name,
+                    "position": staff.position,
+                    "department": staff.department,
                     "roles": user_roles,
                     "access_token": token,
                     "token_type": "Bearer",
@@ -156,6 +207,26 @@ def login():
             "message": f"Login failed: {str(e)}"
         }
 
+def get_login_staff(email):
+    """Get the active staff row for a login email, cached in redis"""
+    cache_key = f"restaurant_login_staff:{email}"
+    staff = frappe.cache().get_value(cache_key)
+    
+    if staff is None:
+        staff = frappe.db.get_value("Restaurant Staff",
+            {"email": email, "employment_status": "Active"},
+            ["name", "full_name", "position", "department", "email"], as_dict=True
+        ) or {}
+        # Unknown emails are remembered briefly too, so repeated probes stay off the database
+        frappe.cache().set_value(cache_key, staff, expires_in_sec=300 if staff else 30)
+    
+    return staff or None
+
+def clear_login_staff_cache(email):
+    """Invalidate the cached login row after a staff record changes"""
+    if email:
+        frappe.cache().delete_value(f"restaurant_login_staff:{email}")
+
 @frappe.whitelist(allow_guest=True)
 def logout():
     """Logout current user"""
@@ -181,13 +252,12 @@ def register_staff():
         frappe.logger().info(f"Registering staff with data: {data}")
         
         # Validate required fields
-        required_fields = ["full_name", "email", "position", "department", "hire_date", "base_hourly_rate"]
-        for field in required_fields:
-            if not data.get(field):
-                return {
-                    "success": False,
-                    "message": f"Missing required field: {field}"
-                }
+        missing_field = next((field for field in REGISTER_STAFF_REQUIRED_FIELDS if not data.get(field)), None)
+        if missing_field:
+            return {
+                "success": False,
+                "message": f"Missing required field: {missing_field}"
+            }
         
         # Check if email already exists
         if frappe.db.exists("User", data["email"]):
@@ -218,11 +288,12 @@ def register_staff():
         frappe.logger().info(f"Staff inserted successfully with name: {staff.name}")
         
         # Create user account
+        name_parts = data["full_name"].split()
         user = frappe.get_doc({
             "doctype": "User",
             "email": data["email"],
-            "first_name": data["full_name"].split()[0],
-            "last_name": " ".join(data["full_name"].split()[1:]) if len(data["full_name"].split()) > 1 else "",
+            "first_name": name_parts[0],
+            "last_name": " ".join(name_parts[1:]),
             "user_type": "System User",
             "send_welcome_email": 0
         })
@@ -261,26 +332,7 @@ def register_staff():
 
 def get_role_for_position(position):
     """Map position to Frappe role"""
-    role_mapping = {
-        "Owner": "Restaurant Owner",
-        "Manager": "Restaurant Manager", 
-        "Assistant Manager": "Restaurant Manager",
-        "Waiter": "Restaurant Staff",
-        "Waitress": "Restaurant Staff",
-        "Server": "Restaurant Staff",
-        "Chef": "Restaurant Kitchen",
-        "Sous Chef": "Restaurant Kitchen", 
-        "Cook": "Restaurant Kitchen",
-        "Kitchen Staff": "Restaurant Kitchen",
-        "Prep Cook": "Restaurant Kitchen",
-        "Cashier": "Restaurant Cashier",
-        "Host": "Restaurant Staff",
-        "Hostess": "Restaurant Staff",
-        "Bartender": "Restaurant Staff",
-        "Dishwasher": "Restaurant Staff",
-        "Busser": "Restaurant Staff"
-    }
-    return role_mapping.get(position, "Restaurant Staff")
+    return POSITION_ROLES.get(position, "Restaurant Staff")
 
 @frappe.whitelist(allow_guest=True)
 def get_current_user_info():
@@ -331,9 +383,10 @@ def reset_password():
         from frappe.utils.password import update_password
         reset_password_key = frappe.generate_hash(length=32)
         
-        # Store reset key
+        # Store reset key, keeping a short-lived copy in redis for the confirmation step
         frappe.db.set_value("User", email, "reset_password_key", reset_password_key)
         frappe.db.commit()
+        frappe.cache().set_value(f"password_reset_key:{email}", reset_password_key, expires_in_sec=300)
         
         # TODO: Send email with reset link
         # For now, return the reset key (in production, this should be emailed)
@@ -365,9 +418,11 @@ def confirm_password_reset():
                 "message": "Email, reset key, and new password are required"
             }
         
-        # Verify reset key
-        stored_key = frappe.db.get_value("User", email, "reset_password_key")
-        if not stored_key or stored_key != reset_key:
+        # Verify reset key in constant time
+        stored_key = frappe.cache().get_value(f"password_reset_key:{email}")
+        if not stored_key:
+            stored_key = frappe.db.get_value("User", email, "reset_password_key")
+        if not stored_key or not hmac.compare_digest(stored_key.encode(), str(reset_key).encode()):
             return {
                 "success": False,
                 "message": "Invalid or expired reset key"
@@ -380,6 +435,7 @@ def confirm_password_reset():
         # Clear reset key
         frappe.db.set_value("User", email, "reset_password_key", "")
         frappe.db.commit()
+        frappe.cache().delete_value(f"password_reset_key:{email}")
         
         return {
             "success": True,
@@ -435,6 +491,15 @@ def change_password():
 # STAFF MANAGEMENT APIs
 # ============================================================================
 
+# Restaurant Staff fields update_staff may change; face data and computed rates have their own paths
+STAFF_UPDATABLE_FIELDS = frozenset({
+    "full_name", "email", "phone", "date_of_birth", "gender",
+    "address", "city", "state", "postal_code",
+    "emergency_contact_name", "emergency_contact_phone", "emergency_contact_relationship",
+    "position", "department", "hire_date", "employment_status",
+    "base_hourly_rate", "weekend_rate", "holiday_rate", "tax_id", "bank_account", "notes"
+})
+
 @frappe.whitelist(allow_guest=True)
 def create_staff(staff_data):
     """Create a new staff member with automatic role assignment"""
@@ -445,7 +510,7 @@ def create_staff(staff_data):
         
         if not has_permission("Restaurant Manager"):
             return {"success": False, "message": "Insufficient permissions. Manager role required."}
-        data = json.loads(staff_data) if isinstance(staff_data, str) else staff_data
+        data = parse_json_data(staff_data)
         
         # Create new staff document
         staff = frappe.get_doc({
@@ -520,7 +585,7 @@ def create_staff(staff_data):
         }
 
 @frappe.whitelist(allow_guest=True)
-def get_staff(staff_id=None):
+def get_staff(staff_id=None, limit_start=0, limit_page_length=50):
     """Get staff member(s)"""
     try:
         # Check authentication and role
@@ -550,15 +615,20 @@ def get_staff(staff_id=None):
                 }
             }
         else:
-            # Get all active staff
+            # Get one page of active staff
+            limit_start, limit_page_length = cint(limit_start), cint(limit_page_length) or 50
             staff_list = frappe.get_all("Restaurant Staff", 
                 filters={"employment_status": "Active"},
                 fields=["name", "full_name", "email", "phone", 
-                        "position", "department", "base_hourly_rate", "face_registered"])
+                        "position", "department", "base_hourly_rate", "face_registered"],
+                order_by="name asc",
+                limit_start=limit_start,
+                limit_page_length=limit_page_length)
             
             return {
                 "success": True,
-                "data": staff_list
+                "data": staff_list,
+                "next_start": limit_start + len(staff_list) if len(staff_list) == limit_page_length else None
             }
             
     except Exception as e:
@@ -571,14 +641,13 @@ def get_staff(staff_id=None):
 def update_staff(staff_id, update_data):
     """Update staff member"""
     try:
-        data = json.loads(update_data) if isinstance(update_data, str) else update_data
+        data = parse_json_data(update_data)
         
         staff = frappe.get_doc("Restaurant Staff", staff_id)
         
         # Update fields
-        for field, value in data.items():
-            if hasattr(staff, field):
-                setattr(staff, field, value)
+        for field in STAFF_UPDATABLE_FIELDS.intersection(data):
+            staff.set(field, data[field])
         
         staff.save()
         
@@ -597,9 +666,16 @@ def update_staff(staff_id, update_data):
 def delete_staff(staff_id):
     """Delete staff member (soft delete by setting status to Terminated)"""
     try:
-        staff = frappe.get_doc("Restaurant Staff", staff_id)
-        staff.employment_status = "Terminated"
-        staff.save()
+        staff = frappe.db.get_value("Restaurant Staff", staff_id, ["full_name", "email"], as_dict=True)
+        if not staff:
+            return {
+                "success": False,
+                "message": f"Staff {staff_id} not found"
+            }
+        
+        frappe.db.set_value("Restaurant Staff", staff_id, "employment_status", "Terminated")
+        # set_value skips the controller hooks, so stop the cached login row from outliving the account
+        clear_login_staff_cache(staff.email)
         
         return {
             "success": True,
@@ -642,13 +718,28 @@ def get_payroll_report(start_date, end_date, department=None):
         if department:
             filters["department"] = department
         
-        staff_list = frappe.get_all("Restaurant Staff", filters=filters)
-        payroll_report = []
+        staff_list = frappe.get_all("Restaurant Staff",
+            filters=filters,
+            fields=["name", "full_name", "base_hourly_rate"]
+        )
         
-        for staff in staff_list:
-            staff_doc = frappe.get_doc("Restaurant Staff", staff.name)
-            payroll_data = staff_doc.calculate_payroll(start_date, end_date)
-            payroll_report.append(payroll_data)
+        # All attendance for the period in one query, summed per staff member in one pass
+        hours_by_staff = defaultdict(float)
+        if staff_list:
+            attendance_records = frappe.get_all("Restaurant Attendance",
+                filters={
+                    "staff_id": ["in", [staff.name for staff in staff_list]],
+                    "date": ["between", [start_date, end_date]]
+                },
+                fields=["staff_id", "check_in_time", "check_out_time"]
+            )
+            for record in attendance_records:
+                hours_by_staff[record.staff_id] += get_attendance_record_hours(record)
+        
+        payroll_report = [
+            build_payroll_item(staff, round(hours_by_staff[staff.name], 2), start_date, end_date)
+            for staff in staff_list
+        ]
         
         # Calculate totals
         total_hours = sum(item["total_hours"] for item in payroll_report)
@@ -673,6 +764,36 @@ def get_payroll_report(start_date, end_date, department=None):
             "message": f"Error generating payroll report: {str(e)}"
         }
 
+def get_attendance_record_hours(record):
+    """Hours between check-in and check-out for one attendance record, 0 while still checked in"""
+    if not (record.check_in_time and record.check_out_time):
+        return 0
+    
+    check_in = frappe.utils.get_datetime(record.check_in_time)
+    check_out = frappe.utils.get_datetime(record.check_out_time)
+    return (check_out - check_in).total_seconds() / 3600
+
+def calculate_attendance_hours(attendance_records):
+    """Calculate total hours between check-in and check-out across attendance records"""
+    return round(sum(get_attendance_record_hours(record) for record in attendance_records), 2)
+
+def build_payroll_item(staff, total_hours, start_date, end_date):
+    """Build the payroll line for a staff member (name, full_name, base_hourly_rate)"""
+    # Basic calculation - can be enhanced with overtime, weekend rates, etc.
+    base_pay = total_hours * staff.base_hourly_rate
+    
+    return {
+        "staff_id": staff.name,
+        "staff_name": staff.full_name,
+        "period": f"{start_date} to {end_date}",
+        "total_hours": total_hours,
+        "base_rate": staff.base_hourly_rate,
+        "base_pay": base_pay,
+        "overtime_hours": 0,  # To be implemented
+        "overtime_pay": 0,    # To be implemented
+        "total_pay": base_pay
+    }
+
 # ============================================================================
 # FACE RECOGNITION APIs
 # ============================================================================
@@ -681,18 +802,26 @@ def get_payroll_report(start_date, end_date, department=None):
 def register_face(staff_id, face_encoding):
     """Register face encoding for staff member"""
     try:
-        staff = frappe.get_doc("Restaurant Staff", staff_id)
-        staff.face_encoding = face_encoding
-        staff.face_registered = 1
-        staff.save()
+        full_name = frappe.db.get_value("Restaurant Staff", staff_id, "full_name")
+        if not full_name:
+            return {
+                "success": False,
+                "message": f"Staff {staff_id} not found"
+            }
+        
+        frappe.db.set_value("Restaurant Staff", staff_id, {
+            "face_encoding": face_encoding,
+            "face_encoding_hash": hash_face_encoding(face_encoding),
+            "face_registered": 1
+        })
         
         return {
             "success": True,
-            "message": f"Face registered successfully for {staff.full_name}",
+            "message": f"Face registered successfully for {full_name}",
             "data": {
-                "staff_id": staff.name,
-                "full_name": staff.full_name,
-                "face_registered": staff.face_registered
+                "staff_id": staff_id,
+                "full_name": full_name,
+                "face_registered": 1
             }
         }
         
@@ -707,7 +836,7 @@ def identify_staff_by_face(face_encoding):
     """Identify staff member by face encoding"""
     try:
         staff = frappe.get_all("Restaurant Staff", 
-            filters={"face_encoding": face_encoding, "employment_status": "Active"},
+            filters={"face_encoding_hash": hash_face_encoding(face_encoding), "employment_status": "Active"},
             fields=["name", "full_name", "position"])
         
         if staff:
@@ -727,34 +856,47 @@ def identify_staff_by_face(face_encoding):
             "message": f"Error identifying staff: {str(e)}"
         }
 
+def hash_face_encoding(face_encoding):
+    """SHA-256 of a face encoding, matched against the indexed face_encoding_hash column"""
+    return hashlib.sha256(face_encoding.encode()).hexdigest() if face_encoding else None
+
 # ============================================================================
 # ATTENDANCE APIs
 # ============================================================================
 
+# Restaurant Attendance columns returned by the attendance report (notes are left out)
+ATTENDANCE_REPORT_FIELDS = [
+    "name", "staff_id", "staff_name", "position", "date",
+    "check_in_time", "check_out_time", "hours_worked", "status", "attendance_method"
+]
+
 @frappe.whitelist(allow_guest=True)
 def mark_attendance(staff_id, action="check_in"):
     """Mark attendance for staff member"""
     try:
-        staff = frappe.get_doc("Restaurant Staff", staff_id)
+        full_name = frappe.db.get_value("Restaurant Staff", staff_id, "full_name")
+        if not full_name:
+            return {
+                "success": False,
+                "message": f"Staff {staff_id} not found"
+            }
+        
         current_time = now_datetime()
         current_date = nowdate()
         
         # Check if attendance record exists for today
-        existing_attendance = frappe.get_all("Restaurant Attendance", 
-            filters={"staff_id": staff_id, "date": current_date},
-            limit=1)
+        existing_attendance = frappe.db.get_value("Restaurant Attendance",
+            {"staff_id": staff_id, "date": current_date},
+            ["name", "check_in_time", "check_out_time"], as_dict=True)
         
         if existing_attendance:
             # Update existing record
-            attendance = frappe.get_doc("Restaurant Attendance", existing_attendance[0].name)
-            if action == "check_out" and not attendance.check_out_time:
-                attendance.check_out_time = current_time
-                attendance.save()
-                message = f"Check-out recorded for {staff.full_name}"
-            elif action == "check_in" and not attendance.check_in_time:
-                attendance.check_in_time = current_time
-                attendance.save()
-                message = f"Check-in recorded for {staff.full_name}"
+            if action == "check_out" and not existing_attendance.check_out_time:
+                frappe.db.set_value("Restaurant Attendance", existing_attendance.name, "check_out_time", current_time)
+                message = f"Check-out recorded for {full_name}"
+            elif action == "check_in" and not existing_attendance.check_in_time:
+                frappe.db.set_value("Restaurant Attendance", existing_attendance.name, "check_in_time", current_time)
+                message = f"Check-in recorded for {full_name}"
             else:
                 return {
                     "success": False,
@@ -770,14 +912,14 @@ def mark_attendance(staff_id, action="check_in"):
                 "check_out_time": current_time if action == "check_out" else None
             })
             attendance.insert()
-            message = f"Check-in recorded for {staff.full_name}"
+            message = f"Check-in recorded for {full_name}"
         
         return {
             "success": True,
             "message": message,
             "data": {
-                "staff_id": staff.name,
-                "staff_name": staff.full_name,
+                "staff_id": staff_id,
+                "staff_name": full_name,
                 "action": action,
                 "time": current_time.strftime("%Y-%m-%d %H:%M:%S")
             }
@@ -797,14 +939,16 @@ def get_attendance_report(staff_id=None, start_date=None, end_date=None):
         
         if staff_id:
             filters["staff_id"] = staff_id
-        if start_date:
+        if start_date and end_date:
+            filters["date"] = ["between", [start_date, end_date]]
+        elif start_date:
             filters["date"] = [">=", start_date]
-        if end_date:
+        elif end_date:
             filters["date"] = ["<=", end_date]
         
         attendance_records = frappe.get_all("Restaurant Attendance", 
             filters=filters,
-            fields=["*"],
+            fields=ATTENDANCE_REPORT_FIELDS,
             order_by="date desc, check_in_time desc")
         
         return {
@@ -822,115 +966,96 @@ def get_attendance_report(staff_id=None, start_date=None, end_date=None):
 # UTILITY APIs
 # ============================================================================
 
+# Static option lists, built once and returned as-is by the option endpoints
+POSITIONS_RESPONSE = {
+    "success": True,
+    "data": ("Manager", "Waiter", "Chef", "Kitchen Staff", "Cashier", "Host/Hostess", "Bartender", "Dishwasher")
+}
+
+DEPARTMENTS_RESPONSE = {
+    "success": True,
+    "data": ("Management", "Service", "Kitchen", "Bar", "Support")
+}
+
+ORDER_TYPES_RESPONSE = {
+    "success": True,
+    "data": ("Dine In", "Takeaway", "Delivery", "Catering")
+}
+
+ORDER_STATUSES_RESPONSE = {
+    "success": True,
+    "data": ("Pending", "Confirmed", "Preparing", "Ready", "Served", "Completed", "Cancelled")
+}
+
+PAYMENT_METHODS_RESPONSE = {
+    "success": True,
+    "data": ("Cash", "Credit Card", "Debit Card", "Mobile Money", "Bank Transfer", "Digital Wallet")
+}
+
+SPICE_LEVELS_RESPONSE = {
+    "success": True,
+    "data": ("Mild", "Medium", "Hot", "Extra Hot")
+}
+
+EMPLOYMENT_STATUSES_RESPONSE = {
+    "success": True,
+    "data": ("Active", "Inactive", "Terminated", "On Leave")
+}
+
+GENDERS_RESPONSE = {
+    "success": True,
+    "data": ("Male", "Female", "Other", "Prefer not to say")
+}
+
+DISCOUNT_TYPES_RESPONSE = {
+    "success": True,
+    "data": ("Fixed Amount", "Percentage", "None")
+}
+
 @frappe.whitelist(allow_guest=True)
 def get_positions():
     """Get list of available positions"""
-    positions = [
-        "Manager", "Waiter", "Chef", "Kitchen Staff", 
-        "Cashier", "Host/Hostess", "Bartender", "Dishwasher"
-    ]
-    
-    return {
-        "success": True,
-        "data": positions
-    }
+    return POSITIONS_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_departments():
     """Get list of available departments"""
-    departments = [
-        "Management", "Service", "Kitchen", "Bar", "Support"
-    ]
-    
-    return {
-        "success": True,
-        "data": departments
-    }
+    return DEPARTMENTS_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_order_types():
     """Get list of available order types"""
-    order_types = [
-        "Dine In", "Takeaway", "Delivery", "Catering"
-    ]
-    
-    return {
-        "success": True,
-        "data": order_types
-    }
+    return ORDER_TYPES_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_order_statuses():
     """Get list of available order statuses"""
-    order_statuses = [
-        "Pending", "Confirmed", "Preparing", "Ready", "Served", "Completed", "Cancelled"
-    ]
-    
-    return {
-        "success": True,
-        "data": order_statuses
-    }
+    return ORDER_STATUSES_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_payment_methods():
     """Get list of available payment methods"""
-    payment_methods = [
-        "Cash", "Credit Card", "Debit Card", "Mobile Money", 
-        "Bank Transfer", "Digital Wallet"
-    ]
-    
-    return {
-        "success": True,
-        "data": payment_methods
-    }
+    return PAYMENT_METHODS_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_spice_levels():
     """Get list of available spice levels"""
-    spice_levels = [
-        "Mild", "Medium", "Hot", "Extra Hot"
-    ]
-    
-    return {
-        "success": True,
-        "data": spice_levels
-    }
+    return SPICE_LEVELS_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_employment_statuses():
     """Get list of available employment statuses"""
-    employment_statuses = [
-        "Active", "Inactive", "Terminated", "On Leave"
-    ]
-    
-    return {
-        "success": True,
-        "data": employment_statuses
-    }
+    return EMPLOYMENT_STATUSES_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_genders():
     """Get list of available gender options"""
-    genders = [
-        "Male", "Female", "Other", "Prefer not to say"
-    ]
-    
-    return {
-        "success": True,
-        "data": genders
-    }
+    return GENDERS_RESPONSE
 
 @frappe.whitelist(allow_guest=True)
 def get_discount_types():
     """Get list of available discount types"""
-    discount_types = [
-        "Fixed Amount", "Percentage", "None"
-    ]
-    
-    return {
-        "success": True,
-        "data": discount_types
-    }
+    return DISCOUNT_TYPES_RESPONSE
 
 # ============================================================================
 # MENU MANAGEMENT APIs
@@ -1371,6 +1496,7 @@ def create_order(order_data):
             "order_type": data.get("order_type", "Dine In"),
             "table_number": data.get("table_number"),
             "waiter": data.get("waiter"),
+            "customer_id": data.get("customer_id"),
             "customer_name": data.get("customer_name"),
             "customer_phone": data.get("customer_phone"),
             "customer_email": data.get("customer_email"),
@@ -1728,20 +1854,62 @@ def get_staff_stats():
 # TABLE BOOKING & RESERVATION SYSTEM
 # ============================================================================
 
+# Default table layout, used until Restaurant Table records are created
+DEFAULT_RESTAURANT_TABLES = [
+    {"table_number": 1, "capacity": 2, "zone": "Main Dining", "features": ["Window View"], "coordinates": {"x": 10, "y": 10}},
+    {"table_number": 2, "capacity": 4, "zone": "Main Dining", "features": ["Window View"], "coordinates": {"x": 10, "y": 30}},
+    {"table_number": 3, "capacity": 6, "zone": "Main Dining", "features": [], "coordinates": {"x": 10, "y": 50}},
+    {"table_number": 4, "capacity": 8, "zone": "Main Dining", "features": ["Large Group"], "coordinates": {"x": 10, "y": 70}},
+    {"table_number": 5, "capacity": 2, "zone": "VIP Section", "features": ["Private", "Window View"], "coordinates": {"x": 50, "y": 10}},
+    {"table_number": 6, "capacity": 4, "zone": "VIP Section", "features": ["Private", "Quiet"], "coordinates": {"x": 50, "y": 30}},
+    {"table_number": 7, "capacity": 6, "zone": "VIP Section", "features": ["Private", "Large Group"], "coordinates": {"x": 50, "y": 50}},
+    {"table_number": 8, "capacity": 2, "zone": "Terrace", "features": ["Outdoor", "Romantic"], "coordinates": {"x": 90, "y": 10}},
+    {"table_number": 9, "capacity": 4, "zone": "Terrace", "features": ["Outdoor"], "coordinates": {"x": 90, "y": 30}},
+    {"table_number": 10, "capacity": 4, "zone": "Bar Area", "features": ["Casual", "Sports View"], "coordinates": {"x": 30, "y": 90}},
+    {"table_number": 11, "capacity": 6, "zone": "Private Dining", "features": ["Private", "Business Meeting"], "coordinates": {"x": 70, "y": 70}},
+    {"table_number": 12, "capacity": 8, "zone": "Private Dining", "features": ["Private", "Large Group", "Business Meeting"], "coordinates": {"x": 70, "y": 90}}
+]
+
+def get_restaurant_tables():
+    """Get the table layout from Restaurant Table, cached in redis until a table changes"""
+    return frappe.cache().get_value("restaurant_tables", generator=load_restaurant_tables)
+
+def load_restaurant_tables():
+    """Load tables from the Restaurant Table DocType, falling back to the default layout"""
+    tables = frappe.get_all("Restaurant Table",
+        fields=["table_number", "capacity", "zone", "features", "coordinate_x", "coordinate_y"],
+        order_by="table_number asc"
+    )
+    if not tables:
+        return DEFAULT_RESTAURANT_TABLES
+    
+    return [{
+        "table_number": t.table_number,
+        "capacity": t.capacity,
+        "zone": t.zone,
+        "features": [f.strip() for f in (t.features or "").split(",") if f.strip()],
+        "coordinates": {"x": t.coordinate_x or 0, "y": t.coordinate_y or 0}
+    } for t in tables]
+
+def clear_restaurant_tables_cache():
+    """Invalidate the cached table layout"""
+    frappe.cache().delete_value("restaurant_tables")
+
+REQUIRED_BOOKING_FIELDS = ("customer_name", "customer_phone", "booking_date", "booking_time", "party_size")
+
 @frappe.whitelist(allow_guest=True)
 def create_table_booking(booking_data):
     """Create a new table reservation"""
     try:
-        data = json.loads(booking_data) if isinstance(booking_data, str) else booking_data
+        data = parse_json_data(booking_data)
         
         # Validate required fields
-        required_fields = ["customer_name", "customer_phone", "booking_date", "booking_time", "party_size"]
-        for field in required_fields:
-            if not data.get(field):
-                return {
-                    "success": False,
-                    "message": f"Missing required field: {field}"
-                }
+        missing_field = next((f for f in REQUIRED_BOOKING_FIELDS if not data.get(f)), None)
+        if missing_field:
+            return {
+                "success": False,
+                "message": f"Missing required field: {missing_field}"
+            }
         
         # Check table availability
         available_tables = get_available_tables(
@@ -1760,7 +1928,7 @@ def create_table_booking(booking_data):
             }
         
         # Generate booking ID
-        booking_id = f"RES-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        booking_id = generate_sortable_id("RES")
         
         # Create booking document
         booking = frappe.get_doc({
@@ -1813,24 +1981,8 @@ def create_table_booking(booking_data):
 def get_available_tables(booking_date, booking_time, party_size, preferred_zone=None, special_requirements=None):
     """Get available tables for specific date, time and party size"""
     try:
-        # Define restaurant table layout (you can move this to a DocType later)
-        restaurant_tables = [
-            {"table_number": 1, "capacity": 2, "zone": "Main Dining", "features": ["Window View"]},
-            {"table_number": 2, "capacity": 4, "zone": "Main Dining", "features": ["Window View"]},
-            {"table_number": 3, "capacity": 6, "zone": "Main Dining", "features": []},
-            {"table_number": 4, "capacity": 8, "zone": "Main Dining", "features": ["Large Group"]},
-            {"table_number": 5, "capacity": 2, "zone": "VIP Section", "features": ["Private", "Window View"]},
-            {"table_number": 6, "capacity": 4, "zone": "VIP Section", "features": ["Private", "Quiet"]},
-            {"table_number": 7, "capacity": 6, "zone": "VIP Section", "features": ["Private", "Large Group"]},
-            {"table_number": 8, "capacity": 2, "zone": "Terrace", "features": ["Outdoor", "Romantic"]},
-            {"table_number": 9, "capacity": 4, "zone": "Terrace", "features": ["Outdoor"]},
-            {"table_number": 10, "capacity": 4, "zone": "Bar Area", "features": ["Casual", "Sports View"]},
-            {"table_number": 11, "capacity": 6, "zone": "Private Dining", "features": ["Private", "Business Meeting"]},
-            {"table_number": 12, "capacity": 8, "zone": "Private Dining", "features": ["Private", "Large Group", "Business Meeting"]}
-        ]
-        
         # Filter tables by capacity (can seat party size)
-        suitable_tables = [t for t in restaurant_tables if t["capacity"] >= int(party_size)]
+        suitable_tables = [t for t in get_restaurant_tables() if t["capacity"] >= int(party_size)]
         
         # Filter by preferred zone if specified
         if preferred_zone:
@@ -1842,41 +1994,8 @@ def get_available_tables(booking_date, booking_time, party_size, preferred_zone=
             suitable_tables = [t for t in suitable_tables 
                              if any(req in t["features"] for req in req_list)]
         
-        # Check existing bookings for conflicts
-        booking_start = f"{booking_date} {booking_time}"
-        booking_end_time = frappe.utils.add_to_date(
-            frappe.utils.get_datetime(booking_start), 
-            hours=2  # Default 2-hour booking
-        )
-        
-        existing_bookings = frappe.get_all("Restaurant Table Booking",
-            filters={
-                "booking_date": booking_date,
-                "booking_status": ["in", ["Confirmed", "Seated"]]
-            },
-            fields=["table_number", "booking_time", "duration_hours"]
-        )
-        
-        # Remove tables that are already booked
-        available_tables = []
-        for table in suitable_tables:
-            is_available = True
-            for booking in existing_bookings:
-                if booking.table_number == table["table_number"]:
-                    existing_start = f"{booking_date} {booking.booking_time}"
-                    existing_end = frappe.utils.add_to_date(
-                        frappe.utils.get_datetime(existing_start),
-                        hours=booking.duration_hours or 2
-                    )
-                    
-                    # Check for time overlap
-                    if (frappe.utils.get_datetime(booking_start) < existing_end and
-                        booking_end_time > frappe.utils.get_datetime(existing_start)):
-                        is_available = False
-                        break
-            
-            if is_available:
-                available_tables.append(table)
+        booked_intervals = get_booked_intervals(get_active_table_bookings(booking_date))
+        available_tables = get_unbooked_tables(suitable_tables, booked_intervals, booking_time)
         
         return {
             "success": True,
@@ -1889,6 +2008,50 @@ def get_available_tables(booking_date, booking_time, party_size, preferred_zone=
             "message": f"Error checking availability: {str(e)}"
         }
 
+def get_booked_intervals(existing_bookings):
+    """Group bookings into (start, end) minute intervals per table, computed once"""
+    booked_intervals = {}
+    for booking in existing_bookings:
+        existing_start = time_to_minutes(booking.booking_time)
+        existing_end = existing_start + int(flt(booking.duration_hours or 2) * 60)
+        booked_intervals.setdefault(booking.table_number, []).append((existing_start, existing_end))
+    
+    return booked_intervals
+
+def get_unbooked_tables(tables, booked_intervals, booking_time):
+    """Remove tables with a booking overlapping booking_time on the same date"""
+    # Check existing bookings for conflicts (minutes since midnight, same date)
+    booking_start = time_to_minutes(booking_time)
+    booking_end = booking_start + 2 * 60  # Default 2-hour booking
+    
+    return [
+        table for table in tables
+        if not any(booking_start < existing_end and existing_start < booking_end
+                   for existing_start, existing_end in booked_intervals.get(table["table_number"], ()))
+    ]
+
+def get_active_table_bookings(booking_date):
+    """Get Confirmed/Seated bookings for a date, cached briefly in redis"""
+    cache_key = f"rtb_day:{getdate(booking_date)}"
+    bookings = frappe.cache().get_value(cache_key)
+    
+    if bookings is None:
+        bookings = frappe.get_all("Restaurant Table Booking",
+            filters={
+                "booking_date": booking_date,
+                "booking_status": ["in", ["Confirmed", "Seated"]]
+            },
+            fields=["table_number", "booking_time", "duration_hours"]
+        )
+        frappe.cache().set_value(cache_key, bookings, expires_in_sec=60)
+    
+    return bookings
+
+def clear_table_booking_cache(booking_date):
+    """Invalidate cached bookings for a date after a booking changes"""
+    if booking_date:
+        frappe.cache().delete_value(f"rtb_day:{getdate(booking_date)}")
+
 @frappe.whitelist(allow_guest=True)
 def get_alternative_time_slots(booking_date, party_size):
     """Get alternative time slots when preferred time is not available"""
@@ -1899,13 +2062,17 @@ def get_alternative_time_slots(booking_date, party_size):
             "17:00", "17:30", "18:00", "18:30", "19:00", "19:30", "20:00", "20:30", "21:00"
         ]
         
+        # Load the day's bookings once and check every slot against them
+        suitable_tables = [t for t in get_restaurant_tables() if t["capacity"] >= int(party_size)]
+        booked_intervals = get_booked_intervals(get_active_table_bookings(booking_date))
+        
         available_slots = []
         for time_slot in time_slots:
-            availability = get_available_tables(booking_date, time_slot, party_size)
-            if availability.get("success") and availability.get("data"):
+            available_tables = get_unbooked_tables(suitable_tables, booked_intervals, time_slot)
+            if available_tables:
                 available_slots.append({
                     "time": time_slot,
-                    "available_tables": len(availability["data"])
+                    "available_tables": len(available_tables)
                 })
         
         return {
@@ -1920,26 +2087,43 @@ def get_alternative_time_slots(booking_date, party_size):
         }
 
 @frappe.whitelist(allow_guest=True)
-def get_table_bookings(date=None, status=None):
-    """Get table bookings with optional filters"""
+def get_table_bookings(date=None, status=None, cursor=None, page_size=50):
+    """Get table bookings with optional filters, newest first, paginated by cursor"""
     try:
-        filters = {}
+        conditions = []
+        values = {"page_size": cint(page_size) or 50}
         if date:
-            filters["booking_date"] = date
+            conditions.append("booking_date = %(date)s")
+            values["date"] = date
         if status:
-            filters["booking_status"] = status
-        
-        bookings = frappe.get_all("Restaurant Table Booking",
-            filters=filters,
-            fields=["booking_id", "customer_name", "customer_phone", "booking_date", 
-                   "booking_time", "party_size", "table_number", "table_zone", 
-                   "booking_status", "special_requests", "occasion"],
-            order_by="booking_date desc, booking_time desc"
-        )
+            conditions.append("booking_status = %(status)s")
+            values["status"] = status
+        if cursor:
+            # Keyset pagination: continue after the last row of the previous page
+            cursor_date, cursor_time, cursor_id = cursor.split(" ", 2)
+            conditions.append("(booking_date, booking_time, booking_id) < (%(cursor_date)s, %(cursor_time)s, %(cursor_id)s)")
+            values.update({"cursor_date": cursor_date, "cursor_time": cursor_time, "cursor_id": cursor_id})
+        
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        bookings = frappe.db.sql(f"""
+            SELECT booking_id, customer_name, customer_phone, booking_date,
+                booking_time, party_size, table_number, table_zone,
+                booking_status, special_requests, occasion
+            FROM `tabRestaurant Table Booking`
+            {where_clause}
+            ORDER BY booking_date DESC, booking_time DESC, booking_id DESC
+            LIMIT %(page_size)s
+        """, values, as_dict=True)
+        
+        next_cursor = None
+        if len(bookings) == values["page_size"]:
+            last = bookings[-1]
+            next_cursor = f"{last.booking_date} {last.booking_time} {last.booking_id}"
         
         return {
             "success": True,
-            "data": bookings
+            "data": bookings,
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -1953,34 +2137,38 @@ def update_booking_status(booking_id, new_status, notes=None):
     """Update booking status (Confirmed, Seated, Completed, Cancelled, No-Show)"""
     try:
         booking = frappe.get_doc("Restaurant Table Booking", booking_id)
-        
+
         old_status = booking.booking_status
-        booking.booking_status = new_status
-        
+        timestamp = frappe.utils.now()
+        updates = {"booking_status": new_status}
+
         if notes:
-            booking.notes = f"{booking.notes}\n{frappe.utils.now()}: {notes}" if booking.notes else notes
-        
-        # Add status change to log
-        status_log = {
-            "timestamp": frappe.utils.now(),
+            updates["notes"] = f"{booking.notes}\n{timestamp}: {notes}" if booking.notes else notes
+
+        # Special actions based on status
+        if new_status == "Seated":
+            updates["actual_arrival_time"] = frappe.utils.nowtime()
+        elif new_status == "Completed":
+            updates["actual_departure_time"] = frappe.utils.nowtime()
+
+        # Write only the changed columns instead of a full save/validate cycle
+        booking.db_set(updates, update_modified=True)
+        clear_table_booking_cache(booking.booking_date)
+
+        # Add status change to log as a single child row insert
+        frappe.get_doc({
+            "doctype": "Restaurant Booking Status Log",
+            "parent": booking.name,
+            "parenttype": "Restaurant Table Booking",
+            "parentfield": "status_history",
+            "idx": len(booking.get("status_history") or []) + 1,
+            "timestamp": timestamp,
             "old_status": old_status,
             "new_status": new_status,
             "changed_by": frappe.session.user,
             "notes": notes or ""
-        }
-        
-        if not hasattr(booking, 'status_history'):
-            booking.status_history = []
-        booking.status_history.append(status_log)
-        
-        # Special actions based on status
-        if new_status == "Seated":
-            booking.actual_arrival_time = frappe.utils.nowtime()
-        elif new_status == "Completed":
-            booking.actual_departure_time = frappe.utils.nowtime()
-        
-        booking.save()
-        
+        }).db_insert()
+
         return {
             "success": True,
             "message": f"Booking status updated to {new_status}",
@@ -2001,9 +2189,9 @@ def update_booking_status(booking_id, new_status, notes=None):
 def add_to_waitlist(waitlist_data):
     """Add customer to waitlist when no tables available"""
     try:
-        data = json.loads(waitlist_data) if isinstance(waitlist_data, str) else waitlist_data
+        data = parse_json_data(waitlist_data)
         
-        waitlist_id = f"WAIT-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        waitlist_id = generate_sortable_id("WAIT")
         
         waitlist = frappe.get_doc({
             "doctype": "Restaurant Waitlist",
@@ -2042,23 +2230,22 @@ def add_to_waitlist(waitlist_data):
 @frappe.whitelist(allow_guest=True)
 def get_waitlist_position(waitlist_id):
     """Get position in waitlist"""
-    try:
-        waitlist_entry = frappe.get_doc("Restaurant Waitlist", waitlist_id)
-        
-        # Count entries added before this one for same date/time
-        earlier_entries = frappe.get_all("Restaurant Waitlist",
-            filters={
-                "requested_date": waitlist_entry.requested_date,
-                "requested_time": waitlist_entry.requested_time,
-                "waitlist_status": "Active",
-                "added_time": ["<", waitlist_entry.added_time]
-            }
-        )
-        
-        return len(earlier_entries) + 1
-        
-    except Exception as e:
+    waitlist_entry = frappe.db.get_value("Restaurant Waitlist", {"waitlist_id": waitlist_id},
+        ["requested_date", "requested_time", "added_time"], as_dict=True)
+    if not waitlist_entry:
         return 0
+    
+    # Count entries added before this one for same date/time
+    earlier_entries = frappe.db.count("Restaurant Waitlist",
+        filters={
+            "requested_date": waitlist_entry.requested_date,
+            "requested_time": waitlist_entry.requested_time,
+            "waitlist_status": "Active",
+            "added_time": ["<", waitlist_entry.added_time]
+        }
+    )
+    
+    return earlier_entries + 1
 
 @frappe.whitelist(allow_guest=True)
 def get_customer_booking_history(customer_phone):
@@ -2068,19 +2255,33 @@ def get_customer_booking_history(customer_phone):
             filters={"customer_phone": customer_phone},
             fields=["booking_id", "customer_name", "booking_date", "booking_time", 
                    "party_size", "table_number", "booking_status", "occasion"],
-            order_by="booking_date desc"
+            order_by="booking_date desc",
+            limit_page_length=20
         )
         
+        # Aggregate preferences and visit counts in the database
+        booking_stats = frappe.db.sql("""
+            SELECT table_zone, party_size, occasion,
+                LPAD(HOUR(booking_time), 2, '0') AS booking_hour,
+                COUNT(*) AS total_bookings,
+                SUM(booking_status = 'Completed') AS total_visits
+            FROM `tabRestaurant Table Booking`
+            WHERE customer_phone = %s
+            GROUP BY table_zone, party_size, occasion, booking_hour
+        """, customer_phone, as_dict=True)
+        
         # Get customer preferences from past bookings
-        preferences = analyze_customer_preferences(bookings)
+        preferences = analyze_customer_preferences(booking_stats)
+        total_bookings = sum(cint(row.total_bookings) for row in booking_stats)
         
         return {
             "success": True,
             "data": {
                 "bookings": bookings,
                 "preferences": preferences,
-                "total_visits": len([b for b in bookings if b.booking_status == "Completed"]),
-                "vip_status": len(bookings) >= 5  # VIP after 5 bookings
+                "total_bookings": total_bookings,
+                "total_visits": sum(cint(row.total_visits) for row in booking_stats),
+                "vip_status": total_bookings >= 5  # VIP after 5 bookings
             }
         }
         
@@ -2090,8 +2291,8 @@ def get_customer_booking_history(customer_phone):
             "message": f"Error retrieving customer history: {str(e)}"
         }
 
-def analyze_customer_preferences(bookings):
-    """Analyze customer preferences from booking history"""
+def analyze_customer_preferences(booking_stats):
+    """Analyze customer preferences from grouped booking counts"""
     preferences = {
         "favorite_table_zones": {},
         "common_party_sizes": {},
@@ -2099,68 +2300,42 @@ def analyze_customer_preferences(bookings):
         "special_occasions": []
     }
     
-    for booking in bookings:
+    for row in booking_stats:
+        count = cint(row.get("total_bookings"))
+        
         # Count zone preferences
-        zone = booking.get("table_zone", "Main Dining")
-        preferences["favorite_table_zones"][zone] = preferences["favorite_table_zones"].get(zone, 0) + 1
+        zone = row.get("table_zone") or "Main Dining"
+        preferences["favorite_table_zones"][zone] = preferences["favorite_table_zones"].get(zone, 0) + count
         
         # Count party size preferences
-        size = str(booking.get("party_size", 2))
-        preferences["common_party_sizes"][size] = preferences["common_party_sizes"].get(size, 0) + 1
+        size = str(row.get("party_size") or 2)
+        preferences["common_party_sizes"][size] = preferences["common_party_sizes"].get(size, 0) + count
         
         # Count time preferences
-        time_hour = booking.get("booking_time", "19:00")[:2]
-        preferences["preferred_times"][time_hour] = preferences["preferred_times"].get(time_hour, 0) + 1
+        time_hour = row.get("booking_hour") or "19"
+        preferences["preferred_times"][time_hour] = preferences["preferred_times"].get(time_hour, 0) + count
         
         # Track occasions
-        if booking.get("occasion"):
-            preferences["special_occasions"].append(booking["occasion"])
+        if row.get("occasion"):
+            preferences["special_occasions"].extend([row["occasion"]] * count)
     
     return preferences
 
 @frappe.whitelist(allow_guest=True)
 def get_restaurant_layout():
     """Get restaurant table layout and zones"""
+    # Group tables by zone, keeping the layout order
+    zones = {}
+    for table in get_restaurant_tables():
+        zones.setdefault(table["zone"], []).append({
+            "number": table["table_number"],
+            "capacity": table["capacity"],
+            "features": table["features"],
+            "coordinates": table["coordinates"]
+        })
+    
     layout = {
-        "zones": [
-            {
-                "name": "Main Dining",
-                "tables": [
-                    {"number": 1, "capacity": 2, "features": ["Window View"], "coordinates": {"x": 10, "y": 10}},
-                    {"number": 2, "capacity": 4, "features": ["Window View"], "coordinates": {"x": 10, "y": 30}},
-                    {"number": 3, "capacity": 6, "features": [], "coordinates": {"x": 10, "y": 50}},
-                    {"number": 4, "capacity": 8, "features": ["Large Group"], "coordinates": {"x": 10, "y": 70}}
-                ]
-            },
-            {
-                "name": "VIP Section", 
-                "tables": [
-                    {"number": 5, "capacity": 2, "features": ["Private", "Window View"], "coordinates": {"x": 50, "y": 10}},
-                    {"number": 6, "capacity": 4, "features": ["Private", "Quiet"], "coordinates": {"x": 50, "y": 30}},
-                    {"number": 7, "capacity": 6, "features": ["Private", "Large Group"], "coordinates": {"x": 50, "y": 50}}
-                ]
-            },
-            {
-                "name": "Terrace",
-                "tables": [
-                    {"number": 8, "capacity": 2, "features": ["Outdoor", "Romantic"], "coordinates": {"x": 90, "y": 10}},
-                    {"number": 9, "capacity": 4, "features": ["Outdoor"], "coordinates": {"x": 90, "y": 30}}
-                ]
-            },
-            {
-                "name": "Bar Area",
-                "tables": [
-                    {"number": 10, "capacity": 4, "features": ["Casual", "Sports View"], "coordinates": {"x": 30, "y": 90}}
-                ]
-            },
-            {
-                "name": "Private Dining",
-                "tables": [
-                    {"number": 11, "capacity": 6, "features": ["Private", "Business Meeting"], "coordinates": {"x": 70, "y": 70}},
-                    {"number": 12, "capacity": 8, "features": ["Private", "Large Group", "Business Meeting"], "coordinates": {"x": 70, "y": 90}}
-                ]
-            }
-        ],
+        "zones": [{"name": name, "tables": tables} for name, tables in zones.items()],
         "operating_hours": {
             "lunch": {"start": "11:00", "end": "15:00"},
             "dinner": {"start": "17:00", "end": "22:00"}
@@ -2184,11 +2359,45 @@ def get_restaurant_layout():
 # ADVANCE PAYMENTS & TIPS MANAGEMENT SYSTEM
 # ============================================================================
 
+# Staff columns needed by the advance and payroll calculations
+STAFF_PAYROLL_FIELDS = ["name", "full_name", "hire_date", "base_hourly_rate", "weekend_rate", "position"]
+
+# Advance policy
+ADVANCE_MONTHLY_HOURS = 160  # Assuming 160 hours/month
+ADVANCE_MAX_SALARY_FRACTION = 0.5  # 50% of monthly salary
+ADVANCE_OUTSTANDING_STATUSES = ("Approved", "Partially Repaid")
+
+# Positions that share in pooled tips
+TIP_ELIGIBLE_POSITIONS = frozenset({"Waiter", "Server", "Bartender", "Host"})
+
+def get_staff_payroll_info(staff_id):
+    """Get the STAFF_PAYROLL_FIELDS row plus employment_days for a staff member, cached in redis for 5 minutes"""
+    cache_key = f"restaurant_staff_payroll:{staff_id}"
+    staff = frappe.cache().get_value(cache_key)
+    
+    if staff is None:
+        # Let the database compute employment length alongside the staff columns
+        rows = frappe.db.sql(f"""
+            SELECT {", ".join(STAFF_PAYROLL_FIELDS)},
+                DATEDIFF(CURDATE(), hire_date) AS employment_days
+            FROM `tabRestaurant Staff`
+            WHERE name = %s
+        """, (staff_id,), as_dict=True)
+        staff = rows[0] if rows else None
+        if staff:
+            frappe.cache().set_value(cache_key, staff, expires_in_sec=300)
+    
+    return staff
+
+def clear_staff_payroll_cache(staff_id):
+    """Invalidate the cached payroll row after a staff record changes"""
+    frappe.cache().delete_value(f"restaurant_staff_payroll:{staff_id}")
+
 @frappe.whitelist(allow_guest=True)
 def request_advance_payment(advance_data):
     """Staff can request advance payment against future salary"""
     try:
-        data = json.loads(advance_data) if isinstance(advance_data, str) else advance_data
+        data = parse_json_data(advance_data)
         
         # Validate required fields
         required_fields = ["staff_id", "amount_requested", "reason"]
@@ -2200,7 +2409,12 @@ def request_advance_payment(advance_data):
                 }
         
         # Get staff information and check eligibility
-        staff = frappe.get_doc("Restaurant Staff", data["staff_id"])
+        staff = get_staff_payroll_info(data["staff_id"])
+        if not staff:
+            return {
+                "success": False,
+                "message": f"Staff {data['staff_id']} not found"
+            }
         
         # Check if staff is eligible for advance (employment duration, previous advances, etc.)
         eligibility = check_advance_eligibility(staff, data["amount_requested"])
@@ -2211,7 +2425,7 @@ def request_advance_payment(advance_data):
             }
         
         # Generate advance request ID
-        advance_id = f"ADV-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        advance_id = generate_record_id("ADV")
         
         # Create advance request
         advance_request = frappe.get_doc({
@@ -2252,10 +2466,10 @@ def request_advance_payment(advance_data):
         }
 
 def check_advance_eligibility(staff, requested_amount):
-    """Check if staff is eligible for advance payment"""
+    """Check if staff (a get_staff_payroll_info row) is eligible for advance payment"""
     try:
         # Basic eligibility rules
-        employment_duration = frappe.utils.date_diff(frappe.utils.nowdate(), staff.hire_date)
+        employment_duration = cint(staff.employment_days)
         
         # Must be employed for at least 30 days
         if employment_duration < 30:
@@ -2266,23 +2480,15 @@ def check_advance_eligibility(staff, requested_amount):
             }
         
         # Calculate maximum advance based on salary and existing advances
-        monthly_salary = staff.base_hourly_rate * 160  # Assuming 160 hours/month
-        max_advance_percentage = 0.5  # 50% of monthly salary
-        max_eligible_amount = monthly_salary * max_advance_percentage
+        monthly_salary = staff.base_hourly_rate * ADVANCE_MONTHLY_HOURS
+        max_eligible_amount = monthly_salary * ADVANCE_MAX_SALARY_FRACTION
         
         # Check existing unpaid advances
-        existing_advances = frappe.get_all("Restaurant Staff Advance",
-            filters={
-                "staff_id": staff.name,
-                "status": ["in", ["Approved", "Partially Repaid"]]
-            },
-            fields=["amount_approved", "amount_repaid"]
-        )
-        
-        total_outstanding = sum(
-            (adv.amount_approved or 0) - (adv.amount_repaid or 0) 
-            for adv in existing_advances
-        )
+        total_outstanding = flt(frappe.db.sql("""
+            SELECT COALESCE(SUM(COALESCE(amount_approved, 0) - COALESCE(amount_repaid, 0)), 0)
+            FROM `tabRestaurant Staff Advance`
+            WHERE staff_id = %s AND status IN %s
+        """, (staff.name, ADVANCE_OUTSTANDING_STATUSES))[0][0])
         
         available_advance = max_eligible_amount - total_outstanding
         
@@ -2310,20 +2516,20 @@ def check_advance_eligibility(staff, requested_amount):
 def approve_advance_payment(advance_id, approval_data):
     """Manager approves/rejects advance payment request"""
     try:
-        data = json.loads(approval_data) if isinstance(approval_data, str) else approval_data
-        
-        advance = frappe.get_doc("Restaurant Staff Advance", advance_id)
+        data = parse_json_data(approval_data)
         
-        # Update advance request
-        advance.status = data["status"]  # "Approved", "Rejected"
-        advance.amount_approved = data.get("amount_approved", advance.amount_requested)
-        advance.approved_by = data.get("approved_by")
-        advance.approval_date = frappe.utils.nowdate()
-        advance.approval_notes = data.get("approval_notes", "")
-        advance.deduction_installments = data.get("deduction_installments", 1)
-        advance.deduction_start_date = data.get("deduction_start_date")
+        advance = frappe.db.get_value("Restaurant Staff Advance", advance_id,
+            ["advance_id", "staff_id", "amount_requested", "reason"], as_dict=True)
+        if not advance:
+            return {
+                "success": False,
+                "message": f"Advance request {advance_id} not found"
+            }
         
-        advance.save()
+        # Update advance request with a single UPDATE of the changed columns
+        updates = build_advance_approval(advance, data)
+        frappe.db.set_value("Restaurant Staff Advance", advance_id, updates, update_modified=True)
+        advance.update(updates)
         
         # If approved, create payment record
         if data["status"] == "Approved":
@@ -2354,25 +2560,109 @@ def approve_advance_payment(advance_id, approval_data):
             "message": f"Error processing advance approval: {str(e)}"
         }
 
+@frappe.whitelist(allow_guest=True)
+def approve_advance_payments_bulk(approvals_data):
+    """Manager approves/rejects several advance requests at once"""
+    try:
+        approvals = parse_json_data(approvals_data)
+        if not approvals:
+            return {
+                "success": False,
+                "message": "No approvals provided"
+            }
+        
+        advances = {adv.name: adv for adv in frappe.get_all("Restaurant Staff Advance",
+            filters={"name": ["in", [item["advance_id"] for item in approvals]]},
+            fields=["name", "advance_id", "staff_id", "amount_requested", "reason"]
+        )}
+        missing = [item["advance_id"] for item in approvals if item["advance_id"] not in advances]
+        if missing:
+            return {
+                "success": False,
+                "message": f"Advance requests not found: {', '.join(missing)}"
+            }
+        
+        updates = {}
+        for item in approvals:
+            updates[item["advance_id"]] = build_advance_approval(advances[item["advance_id"]], item)
+            advances[item["advance_id"]].update(updates[item["advance_id"]])
+        
+        # Update every advance with one UPDATE ... SET col = CASE name WHEN ... END
+        set_clauses = []
+        values = []
+        for field in next(iter(updates.values())):
+            set_clauses.append(f"`{field}` = CASE name {'WHEN %s THEN %s ' * len(updates)}END")
+            for name, row in updates.items():
+                values.extend([name, row[field]])
+        values.extend([frappe.utils.now(), tuple(updates)])
+        frappe.db.sql(f"""
+            UPDATE `tabRestaurant Staff Advance`
+            SET {", ".join(set_clauses)}, modified = %s
+            WHERE name IN %s
+        """, values)
+        
+        # Create payment records for the approved advances in one bulk insert
+        date_part = nowdate().replace("-", "")
+        payments = [
+            build_advance_payment_record(advances[name], generate_record_id("PAY", date_part))
+            for name, row in updates.items() if row["status"] == "Approved"
+        ]
+        bulk_insert_records("Restaurant Staff Payment", payments, "payment_id")
+        payment_ids = {payment["reference_id"]: payment["payment_id"] for payment in payments}
+        
+        return {
+            "success": True,
+            "message": f"Processed {len(updates)} advance requests",
+            "data": [{
+                "advance_id": advance.advance_id,
+                "status": advance.status,
+                "amount_approved": advance.amount_approved,
+                "payment_id": payment_ids.get(advance.advance_id)
+            } for advance in advances.values()]
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error processing advance approvals: {str(e)}"
+        }
+
+def build_advance_approval(advance, data):
+    """Build the Restaurant Staff Advance fields updated by an approval decision"""
+    return {
+        "status": data["status"],  # "Approved", "Rejected"
+        "amount_approved": data.get("amount_approved", advance.amount_requested),
+        "approved_by": data.get("approved_by"),
+        "approval_date": frappe.utils.nowdate(),
+        "approval_notes": data.get("approval_notes", ""),
+        "deduction_installments": data.get("deduction_installments", 1),
+        "deduction_start_date": data.get("deduction_start_date")
+    }
+
+def build_advance_payment_record(advance, payment_id):
+    """Build the Restaurant Staff Payment field values for an approved advance"""
+    return {
+        "payment_id": payment_id,
+        "staff_id": advance.staff_id,
+        "payment_type": "Advance",
+        "amount": advance.amount_approved,
+        "payment_date": frappe.utils.nowdate(),
+        "payment_method": "Bank Transfer",  # Default
+        "reference_id": advance.advance_id,
+        "description": f"Advance payment - {advance.reason}",
+        "status": "Completed"
+    }
+
 def create_advance_payment_record(advance):
     """Create payment record for approved advance"""
     try:
-        payment_id = f"PAY-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
-        
-        payment = frappe.get_doc({
-            "doctype": "Restaurant Staff Payment",
-            "payment_id": payment_id,
-            "staff_id": advance.staff_id,
-            "payment_type": "Advance",
-            "amount": advance.amount_approved,
-            "payment_date": frappe.utils.nowdate(),
-            "payment_method": "Bank Transfer",  # Default
-            "reference_id": advance.advance_id,
-            "description": f"Advance payment - {advance.reason}",
-            "status": "Completed"
-        })
+        payment_id = generate_record_id("PAY")
+        
+        payment = frappe.get_doc(dict(build_advance_payment_record(advance, payment_id),
+            doctype="Restaurant Staff Payment"))
         
-        payment.insert()
+        # Named by payment_id, like the rows bulk_insert_records writes
+        payment.insert(set_name=payment_id)
         return payment_id
         
     except Exception as e:
@@ -2383,15 +2673,45 @@ def create_advance_payment_record(advance):
 def record_tips(tips_data):
     """Record tips received by staff"""
     try:
-        data = json.loads(tips_data) if isinstance(tips_data, str) else tips_data
+        data = parse_json_data(tips_data)
         
         # Support both individual and batch tip recording
         if "tips" in data:
             # Batch recording - multiple staff tips at once
-            results = []
-            for tip in data["tips"]:
-                result = record_single_tip(tip)
-                results.append(result)
+            tips = data["tips"]
+            if len(tips) == 1:
+                results = [record_single_tip(tips[0])]
+            else:
+                # Validate every row up front so the batch fails before anything is written
+                for tip in tips:
+                    if not tip.get("staff_id") or not tip.get("amount"):
+                        return {
+                            "success": False,
+                            "message": "Each tip requires staff_id and amount"
+                        }
+                
+                known_staff = set(frappe.get_all("Restaurant Staff",
+                    filters={"name": ["in", list({tip["staff_id"] for tip in tips})]},
+                    pluck="name"
+                ))
+                unknown_staff = sorted({tip["staff_id"] for tip in tips} - known_staff)
+                if unknown_staff:
+                    return {
+                        "success": False,
+                        "message": f"Unknown staff: {', '.join(unknown_staff)}"
+                    }
+                
+                # Capture the date part once for the whole batch
+                date_part = nowdate().replace("-", "")
+                tip_records = [build_tip_record(tip, generate_record_id("TIP", date_part)) for tip in tips]
+                bulk_insert_tips(tip_records)
+                
+                results = [{
+                    "tip_id": record["tip_id"],
+                    "staff_id": record["staff_id"],
+                    "amount": record["amount"],
+                    "tip_type": record["tip_type"]
+                } for record in tip_records]
             
             return {
                 "success": True,
@@ -2413,29 +2733,60 @@ def record_tips(tips_data):
             "message": f"Error recording tips: {str(e)}"
         }
 
+def build_tip_record(tip_data, tip_id):
+    """Build the Restaurant Staff Tips field values for a tip entry"""
+    return {
+        "tip_id": tip_id,
+        "staff_id": tip_data["staff_id"],
+        "amount": tip_data["amount"],
+        "tip_date": tip_data.get("tip_date", frappe.utils.nowdate()),
+        "tip_time": tip_data.get("tip_time", frappe.utils.nowtime()),
+        "tip_type": tip_data.get("tip_type", "Individual"),  # Individual, Pooled, Credit Card
+        "source": tip_data.get("source", "Cash"),  # Cash, Credit Card, Digital
+        "order_id": tip_data.get("order_id"),  # Link to specific order
+        "table_number": tip_data.get("table_number"),
+        "customer_name": tip_data.get("customer_name"),
+        "notes": tip_data.get("notes", ""),
+        "recorded_by": tip_data.get("recorded_by"),
+        "status": "Confirmed"
+    }
+
+def bulk_insert_records(doctype, records, name_field):
+    """Insert many records with multi-row INSERTs, using records[i][name_field] as the document name"""
+    if not records:
+        return
+    
+    timestamp = frappe.utils.now()
+    user = frappe.session.user
+    record_fields = list(records[0])
+    fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + record_fields
+    values = [
+        [record[name_field], timestamp, timestamp, user, user, 0] + [record[f] for f in record_fields]
+        for record in records
+    ]
+    
+    # Keep all chunks in one savepoint so a failed batch leaves no partial rows
+    frappe.db.savepoint("bulk_insert_records")
+    try:
+        frappe.db.bulk_insert(doctype, fields, values, chunk_size=500)
+    except Exception:
+        frappe.db.rollback(save_point="bulk_insert_records")
+        raise
+    frappe.db.release_savepoint("bulk_insert_records")
+
+def bulk_insert_tips(tip_records):
+    """Insert many tip records with multi-row INSERTs instead of one insert() per tip"""
+    bulk_insert_records("Restaurant Staff Tips", tip_records, "tip_id")
+
 def record_single_tip(tip_data):
     """Record a single tip entry"""
     try:
-        tip_id = f"TIP-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        tip_id = generate_record_id("TIP")
         
-        tip = frappe.get_doc({
-            "doctype": "Restaurant Staff Tips",
-            "tip_id": tip_id,
-            "staff_id": tip_data["staff_id"],
-            "amount": tip_data["amount"],
-            "tip_date": tip_data.get("tip_date", frappe.utils.nowdate()),
-            "tip_time": tip_data.get("tip_time", frappe.utils.nowtime()),
-            "tip_type": tip_data.get("tip_type", "Individual"),  # Individual, Pooled, Credit Card
-            "source": tip_data.get("source", "Cash"),  # Cash, Credit Card, Digital
-            "order_id": tip_data.get("order_id"),  # Link to specific order
-            "table_number": tip_data.get("table_number"),
-            "customer_name": tip_data.get("customer_name"),
-            "notes": tip_data.get("notes", ""),
-            "recorded_by": tip_data.get("recorded_by"),
-            "status": "Confirmed"
-        })
+        tip = frappe.get_doc(dict(build_tip_record(tip_data, tip_id), doctype="Restaurant Staff Tips"))
         
-        tip.insert()
+        # Named by tip_id, like the rows bulk_insert_tips writes
+        tip.insert(set_name=tip_id)
         
         return {
             "tip_id": tip_id,
@@ -2452,7 +2803,7 @@ def record_single_tip(tip_data):
 def distribute_pooled_tips(distribution_data):
     """Distribute pooled tips among staff based on predefined rules"""
     try:
-        data = json.loads(distribution_data) if isinstance(distribution_data, str) else distribution_data
+        data = parse_json_data(distribution_data)
         
         total_pooled_amount = data["total_amount"]
         distribution_date = data.get("distribution_date", frappe.utils.nowdate())
@@ -2476,8 +2827,10 @@ def distribute_pooled_tips(distribution_data):
         )
         
         # Record individual tip distributions
-        distribution_id = f"DIST-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        date_part = nowdate().replace("-", "")
+        distribution_id = generate_record_id("DIST", date_part)
         
+        tip_records = []
         for staff_id, amount in distributions.items():
             if amount > 0:
                 tip_data = {
@@ -2489,7 +2842,9 @@ def distribute_pooled_tips(distribution_data):
                     "notes": f"Pool distribution {distribution_id} - {distribution_method}",
                     "recorded_by": data.get("distributed_by")
                 }
-                record_single_tip(tip_data)
+                tip_records.append(build_tip_record(tip_data, generate_record_id("TIP", date_part)))
+        
+        bulk_insert_tips(tip_records)
         
         return {
             "success": True,
@@ -2514,17 +2869,30 @@ def get_eligible_staff_for_tips(date):
         # Get staff who worked on the date
         attendance_records = frappe.get_all("Restaurant Attendance",
             filters={
-                "attendance_date": date,
+                "date": date,
                 "status": "Present"
             },
             fields=["staff_id", "hours_worked"]
         )
         
+        if not attendance_records:
+            return {}
+        
+        # Fetch all tip-eligible staff for these records in one query
+        staff_rows = frappe.get_all("Restaurant Staff",
+            filters={
+                "name": ["in", list({r.staff_id for r in attendance_records})],
+                "position": ["in", list(TIP_ELIGIBLE_POSITIONS)]
+            },
+            fields=["name", "position", "base_hourly_rate"]
+        )
+        staff_map = {row.name: row for row in staff_rows}
+        
         eligible_staff = {}
         for record in attendance_records:
-            staff = frappe.get_doc("Restaurant Staff", record.staff_id)
+            staff = staff_map.get(record.staff_id)
             # Only include tip-eligible positions
-            if staff.position in ["Waiter", "Server", "Bartender", "Host"]:
+            if staff:
                 eligible_staff[record.staff_id] = {
                     "hours_worked": record.hours_worked or 8,
                     "position": staff.position,
@@ -2539,21 +2907,19 @@ def get_eligible_staff_for_tips(date):
 
 def calculate_tip_distribution(eligible_staff, total_amount, method, date):
     """Calculate how to distribute tips based on method"""
-    distributions = {}
-    
     try:
+        staff_ids = list(eligible_staff)
+        total_amount = flt(total_amount)
+        
         if method == "equal":
             # Equal distribution
-            amount_per_person = total_amount / len(eligible_staff)
-            for staff_id in eligible_staff:
-                distributions[staff_id] = round(amount_per_person, 2)
+            amounts = np.round(np.full(len(staff_ids), total_amount / len(staff_ids)), 2)
                 
         elif method == "hours_worked":
             # Distribution based on hours worked
-            total_hours = sum(staff["hours_worked"] for staff in eligible_staff.values())
-            for staff_id, staff_info in eligible_staff.items():
-                percentage = staff_info["hours_worked"] / total_hours
-                distributions[staff_id] = round(total_amount * percentage, 2)
+            hours = np.fromiter((eligible_staff[staff_id]["hours_worked"] for staff_id in staff_ids),
+                                dtype=np.float64, count=len(staff_ids))
+            amounts = np.round(total_amount * hours / hours.sum(), 2)
                 
         elif method == "performance":
             # Distribution based on performance metrics (orders served, customer ratings, etc.)
@@ -2561,7 +2927,13 @@ def calculate_tip_distribution(eligible_staff, total_amount, method, date):
             # For now, fallback to hours worked
             return calculate_tip_distribution(eligible_staff, total_amount, "hours_worked", date)
         
-        return distributions
+        else:
+            return {}
+        
+        # Give the rounding residual to the last person so the shares add up exactly
+        amounts[-1] = round(amounts[-1] + total_amount - amounts.sum(), 2)
+        
+        return dict(zip(staff_ids, amounts.tolist()))
         
     except Exception as e:
         frappe.log_error(f"Error calculating tip distribution: {str(e)}")
@@ -2597,42 +2969,43 @@ def get_staff_advances(staff_id=None, status=None):
         }
 
 @frappe.whitelist(allow_guest=True)
-def get_staff_tips(staff_id=None, date_from=None, date_to=None):
+def get_staff_tips(staff_id=None, date_from=None, date_to=None, include_rows=True):
     """Get tip records for staff"""
     try:
         filters = {}
         if staff_id:
             filters["staff_id"] = staff_id
-        if date_from:
+        if date_from and date_to:
+            filters["tip_date"] = ["between", [date_from, date_to]]
+        elif date_from:
             filters["tip_date"] = [">=", date_from]
-        if date_to:
-            if "tip_date" in filters:
-                filters["tip_date"] = ["between", [date_from, date_to]]
-            else:
-                filters["tip_date"] = ["<=", date_to]
+        elif date_to:
+            filters["tip_date"] = ["<=", date_to]
+        
+        tips = []
+        if cint(include_rows):
+            tips = frappe.get_all("Restaurant Staff Tips",
+                filters=filters,
+                fields=["tip_id", "staff_id", "amount", "tip_date", "tip_time", 
+                       "tip_type", "source", "order_id", "table_number", "customer_name"],
+                order_by="tip_date desc, tip_time desc"
+            )
         
-        tips = frappe.get_all("Restaurant Staff Tips",
+        # Calculate summary in the database
+        totals_by_type = frappe.get_all("Restaurant Staff Tips",
             filters=filters,
-            fields=["tip_id", "staff_id", "amount", "tip_date", "tip_time", 
-                   "tip_type", "source", "order_id", "table_number", "customer_name"],
-            order_by="tip_date desc, tip_time desc"
+            fields=["tip_type", "sum(amount) as total_amount", "count(*) as total_count"],
+            group_by="tip_type"
         )
         
-        # Calculate summary
-        total_tips = sum(tip.amount for tip in tips)
-        tips_by_type = {}
-        for tip in tips:
-            tip_type = tip.tip_type
-            tips_by_type[tip_type] = tips_by_type.get(tip_type, 0) + tip.amount
-        
         return {
             "success": True,
             "data": {
                 "tips": tips,
                 "summary": {
-                    "total_amount": total_tips,
-                    "total_count": len(tips),
-                    "by_type": tips_by_type
+                    "total_amount": sum(flt(row.total_amount) for row in totals_by_type),
+                    "total_count": sum(cint(row.total_count) for row in totals_by_type),
+                    "by_type": {row.tip_type: flt(row.total_amount) for row in totals_by_type}
                 }
             }
         }
@@ -2643,49 +3016,55 @@ def get_staff_tips(staff_id=None, date_from=None, date_to=None):
             "message": f"Error retrieving tips: {str(e)}"
         }
 
+def get_tips_total(staff_id, period_start, period_end):
+    """Sum a staff member's tips for a period in the database"""
+    return flt(frappe.db.sql("""
+        SELECT COALESCE(SUM(amount), 0)
+        FROM `tabRestaurant Staff Tips`
+        WHERE staff_id = %s AND tip_date BETWEEN %s AND %s
+    """, (staff_id, period_start, period_end))[0][0])
+
 @frappe.whitelist(allow_guest=True)
 def calculate_staff_payroll(staff_id, period_start, period_end):
     """Calculate comprehensive payroll including salary, tips, advances"""
     try:
-        staff = frappe.get_doc("Restaurant Staff", staff_id)
+        staff = get_staff_payroll_info(staff_id)
+        if not staff:
+            return {
+                "success": False,
+                "message": f"Staff {staff_id} not found"
+            }
         
-        # Get attendance for the period
-        attendance = frappe.get_all("Restaurant Attendance",
-            filters={
-                "staff_id": staff_id,
-                "attendance_date": ["between", [period_start, period_end]],
-                "status": "Present"
-            },
-            fields=["attendance_date", "check_in_time", "check_out_time", "hours_worked", "overtime_hours"]
-        )
+        # Get attendance totals for the period, served by the (staff_id, date, status) index
+        total_hours, attendance_days = frappe.db.sql("""
+            SELECT COALESCE(SUM(hours_worked), 0), COUNT(*)
+            FROM `tabRestaurant Attendance`
+            WHERE staff_id = %s AND date BETWEEN %s AND %s AND status = 'Present'
+        """, (staff_id, period_start, period_end))[0]
+        total_hours = flt(total_hours)
+        total_overtime = 0  # Restaurant Attendance does not track overtime yet
         
         # Calculate basic salary
-        total_hours = sum(att.hours_worked or 0 for att in attendance)
-        total_overtime = sum(att.overtime_hours or 0 for att in attendance)
         
         basic_salary = total_hours * staff.base_hourly_rate
         overtime_pay = total_overtime * staff.weekend_rate  # Using weekend rate for overtime
         
         # Get tips for the period
-        tips_response = get_staff_tips(staff_id, period_start, period_end)
-        total_tips = tips_response["data"]["summary"]["total_amount"] if tips_response["success"] else 0
-        
-        # Get advances and calculate deductions
-        advances = frappe.get_all("Restaurant Staff Advance",
-            filters={
-                "staff_id": staff_id,
-                "status": ["in", ["Approved", "Partially Repaid"]],
-                "deduction_start_date": ["<=", period_end]
-            },
-            fields=["advance_id", "amount_approved", "amount_repaid", "deduction_installments"]
-        )
-        
-        total_advance_deduction = 0
-        for advance in advances:
-            outstanding = (advance.amount_approved or 0) - (advance.amount_repaid or 0)
-            if outstanding > 0:
-                installment_amount = outstanding / (advance.deduction_installments or 1)
-                total_advance_deduction += min(installment_amount, outstanding)
+        total_tips = get_tips_total(staff_id, period_start, period_end)
+        
+        # Get advances and calculate deductions (one installment of each outstanding advance)
+        total_advance_deduction = flt(frappe.db.sql("""
+            SELECT COALESCE(SUM(LEAST(
+                (COALESCE(amount_approved, 0) - COALESCE(amount_repaid, 0))
+                    / GREATEST(COALESCE(deduction_installments, 1), 1),
+                COALESCE(amount_approved, 0) - COALESCE(amount_repaid, 0)
+            )), 0)
+            FROM `tabRestaurant Staff Advance`
+            WHERE staff_id = %s
+                AND status IN %s
+                AND deduction_start_date <= %s
+                AND COALESCE(amount_approved, 0) > COALESCE(amount_repaid, 0)
+        """, (staff_id, ADVANCE_OUTSTANDING_STATUSES, period_end))[0][0])
         
         # Calculate net pay
         gross_pay = basic_salary + overtime_pay + total_tips
@@ -2704,7 +3083,7 @@ def calculate_staff_payroll(staff_id, period_start, period_end):
             "advance_deductions": total_advance_deduction,
             "gross_pay": gross_pay,
             "net_pay": net_pay,
-            "attendance_days": len(attendance)
+            "attendance_days": attendance_days
         }
         
         return {
@@ -2722,12 +3101,18 @@ def calculate_staff_payroll(staff_id, period_start, period_end):
 # COMPLIMENTARY SYSTEM & VIP TREATMENT
 # ============================================================================
 
+COMPLIMENTARY_CUSTOMER_FIELDS = ["name", "full_name", "total_visits", "vip_status", "membership_tier", "total_spent"]
+
 @frappe.whitelist(allow_guest=True)
 def auto_trigger_complimentary(customer_id, order_id, trigger_type=None):
     """Automatically trigger complimentary items based on customer profile and occasions"""
     try:
-        customer = frappe.get_doc("Restaurant Customer Profile", customer_id)
-        order = frappe.get_doc("Restaurant Order", order_id)
+        customer = frappe.db.get_value("Restaurant Customer Profile", customer_id, COMPLIMENTARY_CUSTOMER_FIELDS, as_dict=True)
+        if not customer:
+            return {
+                "success": False,
+                "message": f"Customer {customer_id} not found"
+            }
         
         complimentary_items = []
         
@@ -2791,11 +3176,30 @@ def auto_trigger_complimentary(customer_id, order_id, trigger_type=None):
             }
             complimentary_items.append(recognition_item)
         
-        # Record all triggered complimentary items
-        results = []
-        for item in complimentary_items:
-            result = create_complimentary_item(customer_id, order_id, item)
-            results.append(result)
+        # Record all triggered complimentary items with one multi-row INSERT
+        price_map = get_menu_item_prices({item["item_name"] for item in complimentary_items})
+        date_given, time_given = nowdate(), frappe.utils.nowtime()
+        date_part = date_given.replace("-", "")
+        records = [
+            build_complimentary_record(
+                customer_id, order_id, item,
+                generate_record_id("COMP", date_part),
+                price_map.get(item["item_name"]) or 0,
+                date_given, time_given
+            )
+            for item in complimentary_items
+        ]
+        bulk_insert_records("Restaurant Complimentary Item", records, "complimentary_id")
+        
+        results = [
+            {
+                "complimentary_id": record["complimentary_id"],
+                "item_name": record["item_name"],
+                "reason": record["complimentary_reason"],
+                "value": record["original_price"]
+            }
+            for record in records
+        ]
         
         return {
             "success": True,
@@ -2815,56 +3219,68 @@ def auto_trigger_complimentary(customer_id, order_id, trigger_type=None):
 
 def is_customer_birthday(customer):
     """Check if today is customer's birthday"""
-    if not customer.date_of_birth:
-        return False
-    
-    today = frappe.utils.nowdate()
-    birth_date = customer.date_of_birth
-    
-    # Check if month and day match
-    return (today.month == birth_date.month and today.day == birth_date.day)
+    return customer.name in get_todays_occasion_customers("date_of_birth")
 
 def is_customer_anniversary(customer):
     """Check if today is customer's anniversary"""
-    if not customer.anniversary_date:
-        return False
+    return customer.name in get_todays_occasion_customers("anniversary_date")
+
+# Occasion date field -> indexed MMDD generated column added in on_doctype_update
+CUSTOMER_OCCASION_FIELDS = {"date_of_birth": "dob_md", "anniversary_date": "anniversary_md"}
+
+def get_todays_occasion_customers(date_field):
+    """Get the set of customer profiles whose birthday or anniversary is today, cached in redis for an hour"""
+    if date_field not in CUSTOMER_OCCASION_FIELDS:
+        frappe.throw(_("Invalid occasion field: {0}").format(date_field))
     
-    today = frappe.utils.nowdate()
-    anniversary_date = customer.anniversary_date
+    today = getdate()
+    cache_key = f"customer_occasions:{date_field}:{today}"
+    customers = frappe.cache().get_value(cache_key)
     
-    # Check if month and day match
-    return (today.month == anniversary_date.month and today.day == anniversary_date.day)
+    if customers is None:
+        mmdd_column = CUSTOMER_OCCASION_FIELDS[date_field]
+        if frappe.db.has_column("Restaurant Customer Profile", mmdd_column):
+            # Match on the indexed month-day column so only the matching names come back
+            customers = set(frappe.db.sql_list(f"""
+                SELECT name
+                FROM `tabRestaurant Customer Profile`
+                WHERE {mmdd_column} = %s
+            """, (today.strftime("%m%d"),)))
+        else:
+            # Sites that have not synced the generated column yet
+            customers = set(frappe.db.sql_list(f"""
+                SELECT name
+                FROM `tabRestaurant Customer Profile`
+                WHERE MONTH({date_field}) = %s AND DAY({date_field}) = %s
+            """, (today.month, today.day)))
+        frappe.cache().set_value(cache_key, customers, expires_in_sec=3600)
     
-    # Check if month and day match
-    return (today.month == anniversary.month and today.day == anniversary.day)
+    return customers
+
+def clear_customer_occasion_cache():
+    """Invalidate today's cached birthday and anniversary sets after a customer profile changes"""
+    today = getdate()
+    for date_field in CUSTOMER_OCCASION_FIELDS:
+        frappe.cache().delete_value(f"customer_occasions:{date_field}:{today}")
 
 def create_complimentary_item(customer_id, order_id, item_data):
     """Create a complimentary item record"""
     try:
-        complimentary_id = f"COMP-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        complimentary_id = generate_record_id("COMP")
         
         # Get menu item price for tracking
         original_price = get_menu_item_price(item_data["item_name"])
         
-        complimentary = frappe.get_doc({
-            "doctype": "Restaurant Complimentary Item",
-            "complimentary_id": complimentary_id,
-            "customer_id": customer_id,
-            "order_id": order_id,
-            "trigger_type": item_data["trigger_type"],
-            "item_name": item_data["item_name"],
-            "item_type": item_data["item_type"],
-            "quantity": item_data.get("quantity", 1),
-            "original_price": original_price,
-            "complimentary_reason": item_data["complimentary_reason"],
-            "cost_center": item_data["cost_center"],
-            "date_given": frappe.utils.nowdate(),
-            "time_given": frappe.utils.nowtime(),
-            "approved_by": "SYSTEM_AUTO",
-            "status": "Pending"
-        })
+        complimentary = frappe.get_doc(dict(
+            build_complimentary_record(customer_id, order_id, item_data, complimentary_id, original_price),
+            doctype="Restaurant Complimentary Item",
+            name=complimentary_id
+        ))
         
-        complimentary.insert()
+        # System-generated from already validated inputs, so write the row directly
+        complimentary.flags.ignore_permissions = True
+        complimentary.flags.ignore_links = True
+        complimentary.db_insert()
         
         return {
             "complimentary_id": complimentary_id,
@@ -2877,19 +3293,59 @@ def create_complimentary_item(customer_id, order_id, item_data):
         frappe.log_error(f"Error creating complimentary item: {str(e)}")
         return {"error": str(e)}
 
+def build_complimentary_record(customer_id, order_id, item_data, complimentary_id, original_price, date_given=None, time_given=None):
+    """Build the Restaurant Complimentary Item field values; pass date_given/time_given to share one timestamp across a batch"""
+    return {
+        "complimentary_id": complimentary_id,
+        "customer_id": customer_id,
+        "order_id": order_id,
+        "trigger_type": item_data["trigger_type"],
+        "item_name": item_data["item_name"],
+        "item_type": item_data["item_type"],
+        "quantity": item_data.get("quantity", 1),
+        "original_price": original_price,
+        "complimentary_reason": item_data["complimentary_reason"],
+        "cost_center": item_data["cost_center"],
+        "date_given": date_given or nowdate(),
+        "time_given": time_given or frappe.utils.nowtime(),
+        "approved_by": "SYSTEM_AUTO",
+        "status": "Pending"
+    }
+
 def get_menu_item_price(item_name):
-    """Get price of menu item for cost tracking"""
+    """Get price of menu item for cost tracking, cached in redis for an hour"""
     try:
-        price = frappe.db.get_value("Restaurant Menu Item", {"item_name": item_name}, "price")
-        return price if price else 0
+        cache_key = f"menu_item_price:{item_name}"
+        price = frappe.cache().get_value(cache_key)
+        
+        if price is None:
+            price = frappe.db.get_value("Restaurant Menu Item", {"item_name": item_name}, "price") or 0
+            frappe.cache().set_value(cache_key, price, expires_in_sec=3600)
+        
+        return price
     except:
         return 0
 
+def clear_menu_item_price_cache(item_name):
+    """Invalidate the cached price after a menu item changes"""
+    frappe.cache().delete_value(f"menu_item_price:{item_name}")
+
+def get_menu_item_prices(item_names):
+    """Get prices for several menu items in one query, keyed by item name"""
+    if not item_names:
+        return {}
+    
+    rows = frappe.get_all("Restaurant Menu Item",
+        filters={"item_name": ["in", list(item_names)]},
+        fields=["item_name", "price"]
+    )
+    return {row.item_name: row.price for row in rows}
+
 @frappe.whitelist(allow_guest=True)
 def manual_add_complimentary(complimentary_data):
     """Manually add complimentary item (manager override)"""
     try:
-        data = json.loads(complimentary_data) if isinstance(complimentary_data, str) else complimentary_data
+        data = parse_json_data(complimentary_data)
         
         # Validate required fields
         required_fields = ["customer_id", "order_id", "item_name", "reason", "approved_by"]
@@ -2927,61 +3383,63 @@ def manual_add_complimentary(complimentary_data):
             "message": f"Error adding manual complimentary: {str(e)}"
         }
 
+# (predicate(customer, order_total), suggestion template); reason may use {tier}, {order_total} and {visits}
+COMPLIMENTARY_SUGGESTION_RULES = (
+    (lambda customer, order_total: is_customer_birthday(customer), {
+        "type": "birthday",
+        "item": "Birthday Dessert with Candle",
+        "reason": "Customer's birthday today",
+        "priority": "high",
+        "auto_trigger": True
+    }),
+    (lambda customer, order_total: is_customer_anniversary(customer), {
+        "type": "anniversary",
+        "item": "Complimentary Champagne",
+        "reason": "Customer's anniversary today",
+        "priority": "high",
+        "auto_trigger": True
+    }),
+    (lambda customer, order_total: customer.membership_tier in ("Gold", "Platinum", "VIP"), {
+        "type": "vip_perk",
+        "item": "Premium Wine Tasting",
+        "reason": "{tier} member privilege",
+        "priority": "medium",
+        "auto_trigger": False
+    }),
+    (lambda customer, order_total: order_total >= 200, {
+        "type": "high_value",
+        "item": "Chef's Signature Dessert",
+        "reason": "High-value order (${order_total})",
+        "priority": "medium",
+        "auto_trigger": False
+    }),
+    # Every 10th visit, but not a customer with no visits yet
+    (lambda customer, order_total: customer.total_visits and customer.total_visits % 10 == 0, {
+        "type": "loyalty_milestone",
+        "item": "Loyalty Milestone Appetizer",
+        "reason": "Congratulations on your {visits}th visit!",
+        "priority": "medium",
+        "auto_trigger": False
+    })
+)
+
 @frappe.whitelist(allow_guest=True)
 def get_complimentary_suggestions(customer_id, order_total=0):
     """Get AI-powered complimentary suggestions based on customer profile"""
     try:
-        customer = frappe.get_doc("Restaurant Customer Profile", customer_id)
-        suggestions = []
-        
-        # Birthday/Anniversary automatic suggestions
-        if is_customer_birthday(customer):
-            suggestions.append({
-                "type": "birthday",
-                "item": "Birthday Dessert with Candle",
-                "reason": "Customer's birthday today",
-                "priority": "high",
-                "auto_trigger": True
-            })
-        
-        if is_customer_anniversary(customer):
-            suggestions.append({
-                "type": "anniversary", 
-                "item": "Complimentary Champagne",
-                "reason": "Customer's anniversary today",
-                "priority": "high",
-                "auto_trigger": True
-            })
-        
-        # VIP Treatment Suggestions
-        if customer.membership_tier in ["Gold", "Platinum", "VIP"]:
-            suggestions.append({
-                "type": "vip_perk",
-                "item": "Premium Wine Tasting",
-                "reason": f"{customer.membership_tier} member privilege",
-                "priority": "medium",
-                "auto_trigger": False
-            })
-        
-        # High-Value Order Suggestions
-        if float(order_total) >= 200:
-            suggestions.append({
-                "type": "high_value",
-                "item": "Chef's Signature Dessert",
-                "reason": f"High-value order (${order_total})",
-                "priority": "medium", 
-                "auto_trigger": False
-            })
+        customer = frappe.db.get_value("Restaurant Customer Profile", customer_id, COMPLIMENTARY_CUSTOMER_FIELDS, as_dict=True)
+        if not customer:
+            return {
+                "success": False,
+                "message": f"Customer {customer_id} not found"
+            }
         
-        # Loyalty Milestone Suggestions
-        if customer.total_visits % 10 == 0:  # Every 10 visits
-            suggestions.append({
-                "type": "loyalty_milestone",
-                "item": "Loyalty Milestone Appetizer",
-                "reason": f"Congratulations on your {customer.total_visits}th visit!",
-                "priority": "medium",
-                "auto_trigger": False
-            })
+        reason_values = {"tier": customer.membership_tier, "order_total": order_total, "visits": customer.total_visits}
+        suggestions = [
+            dict(template, reason=template["reason"].format(**reason_values))
+            for applies, template in COMPLIMENTARY_SUGGESTION_RULES
+            if applies(customer, flt(order_total))
+        ]
         
         return {
             "success": True,
@@ -2999,63 +3457,84 @@ def get_complimentary_suggestions(customer_id, order_total=0):
             "message": f"Error getting complimentary suggestions: {str(e)}"
         }
 
+# Open-ended date range bounds for history filters
+MIN_FILTER_DATE = "1900-01-01"
+MAX_FILTER_DATE = "2999-12-31"
+
+COMPLIMENTARY_HISTORY_FIELDS = [
+    "complimentary_id", "customer_id", "item_name", "item_type",
+    "quantity", "original_price", "trigger_type", "complimentary_reason",
+    "date_given", "time_given", "cost_center", "status"
+]
+
 @frappe.whitelist(allow_guest=True)
-def get_complimentary_history(customer_id=None, date_from=None, date_to=None):
-    """Get complimentary items history with cost analysis"""
-    try:
-        filters = {}
-        
+def get_complimentary_history(customer_id=None, date_from=None, date_to=None, details=True,
+        limit_start=0, limit_page_length=100, fields=None):
+    """Get a page of complimentary items history with cost analysis over the full filtered range"""
+    try:
+        limit_start, limit_page_length = cint(limit_start), cint(limit_page_length) or 100
+        
+        # Let callers drop columns they do not need, but only from the allowlist
+        if isinstance(fields, str):
+            fields = parse_json_data(fields) if fields.startswith("[") else fields.split(",")
+        requested = set(fields or [])
+        fields = [field for field in COMPLIMENTARY_HISTORY_FIELDS if field in requested] or COMPLIMENTARY_HISTORY_FIELDS
+        
+        # Always filter on a date range so the statement keeps one shape per customer filter
+        conditions = ["date_given BETWEEN %(date_from)s AND %(date_to)s"]
+        values = {
+            "date_from": date_from or MIN_FILTER_DATE,
+            "date_to": date_to or MAX_FILTER_DATE,
+            "limit_start": limit_start,
+            "limit_page_length": limit_page_length
+        }
         if customer_id:
-            filters["customer_id"] = customer_id
-        
-        if date_from:
-            filters["date_given"] = [">=", date_from]
+            conditions.append("customer_id = %(customer_id)s")
+            values["customer_id"] = customer_id
         
-        if date_to:
-            if "date_given" in filters:
-                filters["date_given"] = ["between", [date_from, date_to]]
-            else:
-                filters["date_given"] = ["<=", date_to]
+        where_clause = f"WHERE {' AND '.join(conditions)}"
         
-        complimentary_items = frappe.get_all("Restaurant Complimentary Item",
-            filters=filters,
-            fields=[
-                "complimentary_id", "customer_id", "item_name", "item_type",
-                "quantity", "original_price", "trigger_type", "complimentary_reason",
-                "date_given", "time_given", "cost_center", "status"
-            ],
-            order_by="date_given desc"
-        )
-        
-        # Calculate analytics
-        total_value = sum(item.original_price * item.quantity for item in complimentary_items if item.original_price)
-        by_trigger_type = {}
-        by_cost_center = {}
-        
-        for item in complimentary_items:
-            # Group by trigger type
-            trigger = item.trigger_type
-            if trigger not in by_trigger_type:
-                by_trigger_type[trigger] = {"count": 0, "value": 0}
-            by_trigger_type[trigger]["count"] += 1
-            by_trigger_type[trigger]["value"] += (item.original_price or 0) * item.quantity
-            
-            # Group by cost center
-            cost_center = item.cost_center
-            if cost_center not in by_cost_center:
-                by_cost_center[cost_center] = {"count": 0, "value": 0}
-            by_cost_center[cost_center]["count"] += 1
-            by_cost_center[cost_center]["value"] += (item.original_price or 0) * item.quantity
+        complimentary_items = []
+        if cint(details):
+            complimentary_items = frappe.db.sql(f"""
+                SELECT {", ".join(fields)}
+                FROM `tabRestaurant Complimentary Item`
+                {where_clause}
+                ORDER BY date_given DESC
+                LIMIT %(limit_page_length)s OFFSET %(limit_start)s
+            """, values, as_dict=True)
+        
+        # Calculate analytics in the database, one row per trigger type / cost center pair
+        group_totals = frappe.db.sql(f"""
+            SELECT trigger_type, cost_center, COUNT(*) AS item_count,
+                SUM(COALESCE(original_price, 0) * quantity) AS item_value
+            FROM `tabRestaurant Complimentary Item`
+            {where_clause}
+            GROUP BY trigger_type, cost_center
+        """, values, as_dict=True)
+        
+        # Roll the pairs up into both breakdowns in a single pass
+        by_trigger_type = defaultdict(lambda: {"count": 0, "value": 0})
+        by_cost_center = defaultdict(lambda: {"count": 0, "value": 0})
+        total_items, total_value = 0, 0
+        for row in group_totals:
+            count, value = cint(row.item_count), flt(row.item_value)
+            for group in (by_trigger_type[row.trigger_type], by_cost_center[row.cost_center]):
+                group["count"] += count
+                group["value"] += value
+            total_items += count
+            total_value += value
         
         return {
             "success": True,
             "data": {
                 "complimentary_items": complimentary_items,
+                "has_more": bool(complimentary_items) and limit_start + len(complimentary_items) < total_items,
                 "analytics": {
-                    "total_items": len(complimentary_items),
+                    "total_items": total_items,
                     "total_value": total_value,
-                    "by_trigger_type": by_trigger_type,
-                    "by_cost_center": by_cost_center
+                    "by_trigger_type": dict(by_trigger_type),
+                    "by_cost_center": dict(by_cost_center)
                 }
             }
         }
@@ -3071,6 +3550,78 @@ def get_complimentary_history(customer_id=None, date_from=None, date_to=None):
 # LOYALTY PROGRAM SYSTEM
 # ============================================================================
 
+TIER_MULTIPLIERS = {
+    "Bronze": 1.0,
+    "Silver": 1.1,
+    "Gold": 1.25,
+    "Platinum": 1.5,
+    "VIP": 2.0,
+    "Founder": 2.5
+}
+
+# (threshold, tier) pairs, highest threshold first
+TIER_THRESHOLDS = (
+    (50000, "Founder"),
+    (15000, "VIP"),
+    (5000, "Platinum"),
+    (1500, "Gold"),
+    (500, "Silver"),
+    (0, "Bronze")
+)
+TIER_MIN_POINTS = {tier: threshold for threshold, tier in TIER_THRESHOLDS}
+
+TIER_BENEFITS = {
+    "Bronze": ["1x points", "Birthday reward"],
+    "Silver": ["1.1x points", "Birthday reward", "Free appetizer monthly"],
+    "Gold": ["1.25x points", "Birthday reward", "Free appetizer monthly", "Priority reservations"],
+    "Platinum": ["1.5x points", "Birthday + Anniversary rewards", "Free appetizer monthly", "Priority reservations", "Complimentary valet"],
+    "VIP": ["2x points", "All rewards", "Monthly free dinner", "Private dining access", "Personal concierge"],
+    "Founder": ["2.5x points", "All rewards", "Weekly free dinner", "Exclusive events", "Chef's table access"]
+}
+TIER_BENEFITS_JSON = {tier: json.dumps(benefits) for tier, benefits in TIER_BENEFITS.items()}
+
+TIER_UPGRADE_REWARDS = {
+    "Silver": 100,
+    "Gold": 250,
+    "Platinum": 500,
+    "VIP": 1000,
+    "Founder": 2500
+}
+
+TIER_PROGRESSION = {
+    "Bronze": "Silver",
+    "Silver": "Gold",
+    "Gold": "Platinum",
+    "Platinum": "VIP",
+    "VIP": "Founder",
+    "Founder": "Founder"  # Max tier
+}
+
+# Lifetime points needed to reach the next tier, for every tier below the max
+NEXT_TIER_MIN_POINTS = {
+    tier: TIER_MIN_POINTS[next_tier]
+    for tier, next_tier in TIER_PROGRESSION.items()
+    if next_tier != tier
+}
+
+BONUS_POINTS = {
+    "birthday": 100,
+    "anniversary": 150,
+    "referral": 200,
+    "review": 50,
+    "social_share": 25,
+    "first_visit": 100,
+    "large_order": 50
+}
+
+REDEMPTION_RATES = {
+    "discount": 0.01,  # $0.01 per point
+    "free_appetizer": 500,  # 500 points = free appetizer
+    "free_dessert": 300,   # 300 points = free dessert
+    "free_drink": 200,     # 200 points = free drink
+    "percentage_off": 0.005  # $0.005 per point (5% off per 1000 points)
+}
+
 @frappe.whitelist(allow_guest=True)
 def add_loyalty_points(customer_id, order_total, bonus_reason=None):
     """Add loyalty points based on order total and tier multipliers"""
@@ -3097,15 +3648,16 @@ def add_loyalty_points(customer_id, order_total, bonus_reason=None):
         loyalty.current_points += earned_points
         loyalty.lifetime_points += earned_points
         loyalty.last_activity = frappe.utils.now()
+        updates = {"lifetime_points": loyalty.lifetime_points, "last_activity": loyalty.last_activity}
         
         # Check for tier upgrade
         new_tier = calculate_tier_upgrade(loyalty)
         tier_upgraded = new_tier != loyalty.current_tier
         
         if tier_upgraded:
-            old_tier = loyalty.current_tier
             loyalty.current_tier = new_tier
             loyalty.tier_benefits = get_tier_benefits(new_tier)
+            updates.update({"current_tier": loyalty.current_tier, "tier_benefits": loyalty.tier_benefits})
             
             # Trigger tier upgrade rewards
             tier_upgrade_reward = get_tier_upgrade_reward(new_tier)
@@ -3113,7 +3665,8 @@ def add_loyalty_points(customer_id, order_total, bonus_reason=None):
                 loyalty.current_points += tier_upgrade_reward
                 earned_points += tier_upgrade_reward
         
-        loyalty.save()
+        updates["current_points"] = loyalty.current_points
+        frappe.db.set_value("Restaurant Loyalty Program", loyalty.name, updates, update_modified=False)
         
         # Log points transaction
         log_points_transaction(customer_id, earned_points, "earned", f"Order purchase: ${order_total}")
@@ -3157,30 +3710,13 @@ def get_or_create_loyalty_record(customer_id):
 
 def get_tier_bonus_multiplier(tier):
     """Get point multiplier based on tier"""
-    multipliers = {
-        "Bronze": 1.0,
-        "Silver": 1.1,
-        "Gold": 1.25,
-        "Platinum": 1.5,
-        "VIP": 2.0,
-        "Founder": 2.5
-    }
-    return multipliers.get(tier, 1.0)
+    return TIER_MULTIPLIERS.get(tier, 1.0)
 
 def calculate_tier_upgrade(loyalty):
     """Calculate if customer should be upgraded to new tier"""
-    tier_thresholds = {
-        "Bronze": 0,
-        "Silver": 500,
-        "Gold": 1500,
-        "Platinum": 5000,
-        "VIP": 15000,
-        "Founder": 50000
-    }
-    
     lifetime_points = loyalty.lifetime_points
     
-    for tier, threshold in reversed(tier_thresholds.items()):
+    for threshold, tier in TIER_THRESHOLDS:
         if lifetime_points >= threshold:
             return tier
     
@@ -3188,21 +3724,13 @@ def calculate_tier_upgrade(loyalty):
 
 def get_tier_benefits(tier):
     """Get benefits for specific tier"""
-    benefits = {
-        "Bronze": ["1x points", "Birthday reward"],
-        "Silver": ["1.1x points", "Birthday reward", "Free appetizer monthly"],
-        "Gold": ["1.25x points", "Birthday reward", "Free appetizer monthly", "Priority reservations"],
-        "Platinum": ["1.5x points", "Birthday + Anniversary rewards", "Free appetizer monthly", "Priority reservations", "Complimentary valet"],
-        "VIP": ["2x points", "All rewards", "Monthly free dinner", "Private dining access", "Personal concierge"],
-        "Founder": ["2.5x points", "All rewards", "Weekly free dinner", "Exclusive events", "Chef's table access"]
-    }
-    return json.dumps(benefits.get(tier, []))
+    return TIER_BENEFITS_JSON.get(tier, "[]")
 
 @frappe.whitelist(allow_guest=True)
 def redeem_loyalty_points(customer_id, redemption_data):
     """Redeem loyalty points for rewards"""
     try:
-        data = json.loads(redemption_data) if isinstance(redemption_data, str) else redemption_data
+        data = parse_json_data(redemption_data)
         
         loyalty = frappe.get_doc("Restaurant Loyalty Program", customer_id)
         
@@ -3221,8 +3749,11 @@ def redeem_loyalty_points(customer_id, redemption_data):
         
         # Deduct points
         loyalty.current_points -= points_to_redeem
-        loyalty.points_redeemed += points_to_redeem
-        loyalty.save()
+        loyalty.points_redeemed = (loyalty.points_redeemed or 0) + points_to_redeem
+        frappe.db.set_value("Restaurant Loyalty Program", loyalty.name, {
+            "current_points": loyalty.current_points,
+            "points_redeemed": loyalty.points_redeemed
+        }, update_modified=False)
         
         # Log redemption
         log_points_transaction(customer_id, points_to_redeem, "redeemed", f"Redemption: {redemption_type}")
@@ -3245,29 +3776,69 @@ def redeem_loyalty_points(customer_id, redemption_data):
         }
 
 def log_points_transaction(customer_id, points, transaction_type, description):
-    """Log points transaction for audit trail"""
+    """Queue a points transaction for the audit trail; queued rows are bulk-inserted just before commit"""
     try:
-        transaction_id = f"PTS-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        pending = getattr(frappe.local, "pending_points_transactions", None)
+        if pending is None:
+            pending = frappe.local.pending_points_transactions = []
+            frappe.db.before_commit.add(flush_points_transactions)
+            frappe.db.after_rollback.add(discard_points_transactions)
         
-        # This would create a points transaction log
-        # For now, just log to system
-        frappe.log_error(f"Points Transaction: {customer_id} - {transaction_type} {points} points - {description}", "Loyalty Points")
+        pending.append({
+            "transaction_id": generate_record_id("PTS"),
+            "customer_id": customer_id,
+            "transaction_type": transaction_type,
+            "points": points,
+            "description": description,
+            "transaction_time": frappe.utils.now()
+        })
         
     except Exception as e:
         frappe.log_error(f"Error logging points transaction: {str(e)}")
 
+def flush_points_transactions():
+    """Write all queued points transactions with one multi-row INSERT"""
+    pending = getattr(frappe.local, "pending_points_transactions", None)
+    frappe.local.pending_points_transactions = None
+    if pending:
+        bulk_insert_records("Restaurant Points Transaction", pending, "transaction_id")
+
+def discard_points_transactions():
+    """Drop queued points transactions when their transaction is rolled back"""
+    frappe.local.pending_points_transactions = None
+
 
 # ============================================================================
 # EVENT MANAGEMENT SYSTEM
 # ============================================================================
 
+EVENT_BASE_COST_PER_PERSON = 75
+
+PRIVATE_DINING_ROOMS = (
+    "Main Private Room",
+    "VIP Suite",
+    "Wine Cellar Room",
+    "Chef's Table",
+    "Outdoor Terrace",
+    "Rooftop Space"
+)
+
+EVENT_TYPE_MULTIPLIERS = {
+    "Wedding Reception": 1.5,
+    "Corporate Event": 1.3,
+    "Wine Tasting": 1.2,
+    "Chef's Table": 1.8,
+    "Birthday Party": 1.0,
+    "Private Dining": 1.1
+}
+
 @frappe.whitelist(allow_guest=True)
 def create_event_booking(event_data):
     """Create new event booking"""
     try:
-        data = json.loads(event_data) if isinstance(event_data, str) else event_data
+        data = parse_json_data(event_data)
         
-        event_id = f"EVT-{frappe.utils.now()[:10].replace('-', '')}-{frappe.utils.random_string(4).upper()}"
+        event_id = generate_record_id("EVT")
         
         # Calculate suggested deposit (20% of estimated cost)
         estimated_cost = estimate_event_cost(data)
@@ -3297,8 +3868,13 @@ def create_event_booking(event_data):
         
         event.insert()
         
-        # Send confirmation email (simulate)
-        send_event_confirmation_email(event)
+        # Send confirmation email (simulate) from a background worker once the booking is committed
+        frappe.enqueue(
+            "restaurant_management.api.send_event_confirmation_email",
+            queue="short",
+            enqueue_after_commit=True,
+            event_id=event.name
+        )
         
         return {
             "success": True,
@@ -3324,12 +3900,10 @@ def create_event_booking(event_data):
 
 def estimate_event_cost(event_data):
     """Estimate event cost based on parameters"""
-    base_cost_per_person = 75  # Base cost per guest
-    
     guests = int(event_data.get("expected_guests", 0))
     duration = float(event_data.get("duration_hours", 3.0))
     
-    base_cost = guests * base_cost_per_person
+    base_cost = guests * EVENT_BASE_COST_PER_PERSON
     
     # Duration multiplier
     if duration > 4:
@@ -3338,17 +3912,8 @@ def estimate_event_cost(event_data):
         base_cost *= 1.4
     
     # Event type multiplier
-    event_type_multipliers = {
-        "Wedding Reception": 1.5,
-        "Corporate Event": 1.3,
-        "Wine Tasting": 1.2,
-        "Chef's Table": 1.8,
-        "Birthday Party": 1.0,
-        "Private Dining": 1.1
-    }
-    
     event_type = event_data.get("event_type", "Private Dining")
-    multiplier = event_type_multipliers.get(event_type, 1.0)
+    multiplier = EVENT_TYPE_MULTIPLIERS.get(event_type, 1.0)
     
     estimated_cost = base_cost * multiplier
     
@@ -3358,17 +3923,8 @@ def estimate_event_cost(event_data):
 def check_event_availability(event_date, event_time, duration_hours, room_preference=None):
     """Check availability for event booking"""
     try:
-        # Get existing bookings for the date
-        existing_bookings = frappe.get_all("Restaurant Event Booking",
-            filters={
-                "event_date": event_date,
-                "event_status": ["not in", ["Cancelled"]]
-            },
-            fields=["event_time", "duration_hours", "private_dining_room"]
-        )
-        
         # Check room availability
-        available_rooms = get_available_rooms(event_date, event_time, duration_hours, existing_bookings)
+        available_rooms = get_available_rooms(event_date, event_time, duration_hours)
         
         # Check staff availability
         staff_availability = check_staff_availability(event_date, event_time, duration_hours)
@@ -3397,32 +3953,30 @@ def check_event_availability(event_date, event_time, duration_hours, room_prefer
             "message": f"Error checking availability: {str(e)}"
         }
 
-def get_available_rooms(event_date, event_time, duration_hours, existing_bookings):
+def get_available_rooms(event_date, event_time, duration_hours):
     """Get list of available private dining rooms"""
-    all_rooms = [
-        "Main Private Room",
-        "VIP Suite", 
-        "Wine Cellar Room",
-        "Chef's Table",
-        "Outdoor Terrace",
-        "Rooftop Space"
-    ]
-    
-    # Filter out booked rooms
-    booked_rooms = []
-    for booking in existing_bookings:
-        if is_time_conflict(event_time, duration_hours, booking.event_time, booking.duration_hours):
-            booked_rooms.append(booking.private_dining_room)
-    
-    available_rooms = [room for room in all_rooms if room not in booked_rooms]
+    # Let the database return only the rooms whose bookings overlap the requested slot
+    booked_rooms = set(frappe.db.sql_list("""
+        SELECT DISTINCT private_dining_room
+        FROM `tabRestaurant Event Booking`
+        WHERE event_date = %(event_date)s
+            AND COALESCE(event_status, '') != 'Cancelled'
+            AND private_dining_room IS NOT NULL
+            AND event_time < ADDTIME(CAST(%(event_time)s AS TIME), SEC_TO_TIME(%(duration)s * 3600))
+            AND ADDTIME(event_time, SEC_TO_TIME(COALESCE(duration_hours, 0) * 3600)) > CAST(%(event_time)s AS TIME)
+    """, {"event_date": event_date, "event_time": event_time, "duration": flt(duration_hours)}))
     
-    return available_rooms
+    return [room for room in PRIVATE_DINING_ROOMS if room not in booked_rooms]
 
 
 # ============================================================================
 # CUSTOMER FEEDBACK SYSTEM  
 # ============================================================================
 
+# Feedback types that always need a manager's attention
+HIGH_PRIORITY_FEEDBACK_TYPES = frozenset(["Complaint", "Food Issue", "Service Issue", "Billing Issue"])
+MEDIUM_PRIORITY_FEEDBACK_TYPES = frozenset(["Staff Recognition"])
+
 @frappe.whitelist(allow_guest=True)
 def submit_customer_feedback(feedback_data):
     """Submit customer feedback"""
@@ -3461,8 +4015,13 @@ def submit_customer_feedback(feedback_data):
         
         feedback.insert()
         
-        # Auto-trigger actions based on feedback
-        trigger_feedback_actions(feedback)
+        # Auto-trigger actions based on feedback from a background worker once the feedback is committed
+        frappe.enqueue(
+            "restaurant_management.api.trigger_feedback_actions",
+            queue="short",
+            enqueue_after_commit=True,
+            feedback_name=feedback.name
+        )
         
         return {
             "success": True,
@@ -3482,95 +4041,104 @@ def submit_customer_feedback(feedback_data):
 
 def determine_feedback_priority(data):
     """Determine feedback priority based on content"""
-    overall_rating = int(data.get("overall_rating", "3").split()[0])
+    overall_rating = parse_rating(data.get("overall_rating", "3"))
     feedback_type = data.get("feedback_type", "")
     
     # High priority conditions
-    if overall_rating <= 2:
+    if overall_rating <= 2 or feedback_type in HIGH_PRIORITY_FEEDBACK_TYPES:
         return "High"
     
-    if feedback_type in ["Complaint", "Food Issue", "Service Issue", "Billing Issue"]:
-        return "High"
-    
-    if data.get("negative_comments") and len(data.get("negative_comments", "")) > 50:
-        return "Medium"
-    
-    if feedback_type == "Staff Recognition":
+    if len(data.get("negative_comments") or "") > 50 or feedback_type in MEDIUM_PRIORITY_FEEDBACK_TYPES:
         return "Medium"
     
     return "Low"
 
-def trigger_feedback_actions(feedback):
+def trigger_feedback_actions(feedback_name):
     """Trigger automatic actions based on feedback"""
     try:
+        feedback = frappe.get_doc("Restaurant Customer Feedback", feedback_name)
+        
         # High priority feedback triggers immediate alerts
         if feedback.priority in ["High", "Urgent"]:
             send_management_alert(feedback)
         
         # Positive feedback triggers staff recognition
-        if feedback.staff_member_mentioned and feedback.overall_rating >= "4":
+        if feedback.staff_member_mentioned and feedback.overall_rating_value >= 4:
             record_staff_recognition(feedback.staff_member_mentioned, feedback.positive_comments)
         
         # Low ratings trigger follow-up requirements
-        if int(feedback.overall_rating.split()[0]) <= 3:
+        if feedback.overall_rating_value <= 3:
             schedule_follow_up(feedback)
             
     except Exception as e:
         frappe.log_error(f"Error triggering feedback actions: {str(e)}")
 
+# Average rating key -> Restaurant Customer Feedback column
+FEEDBACK_RATING_FIELDS = {
+    "overall": "overall_rating",
+    "food_quality": "food_quality_rating",
+    "service": "service_rating",
+    "ambiance": "ambiance_rating",
+    "value": "value_rating",
+    "speed": "speed_rating"
+}
+
+def parse_rating(rating):
+    """Numeric part of a "4 - Very Good" rating label, 0 when unrated"""
+    # Rating options are "1 - Poor" .. "5 - Excellent", so the leading character is the digit
+    return ord(rating[0]) - 48 if rating else 0
+
 @frappe.whitelist(allow_guest=True)
 def get_feedback_analytics(date_from=None, date_to=None):
-    """Get comprehensive feedback analytics"""
+    """Get comprehensive feedback analytics, cached in redis for 2 minutes per date range"""
     try:
-        filters = {}
+        cache_key = f"feedback_analytics:{date_from}:{date_to}"
+        cached = frappe.cache().get_value(cache_key)
+        if cached:
+            return cached
         
-        if date_from:
-            filters["visit_date"] = [">=", date_from]
-        if date_to:
-            if "visit_date" in filters:
-                filters["visit_date"] = ["between", [date_from, date_to]]
-            else:
-                filters["visit_date"] = ["<=", date_to]
+        values = {"date_from": date_from or MIN_FILTER_DATE, "date_to": date_to or MAX_FILTER_DATE}
         
-        feedbacks = frappe.get_all("Restaurant Customer Feedback",
-            filters=filters,
-            fields=[
-                "feedback_id", "feedback_type", "overall_rating", "food_quality_rating",
-                "service_rating", "ambiance_rating", "value_rating", "speed_rating",
-                "would_recommend", "likelihood_to_return", "visit_date", "priority", "status"
-            ]
-        )
+        # Rating values are 1-5, so 0 means unrated and is left out of the aggregates
+        overall = "NULLIF(overall_rating_value, 0)"
         
-        # Calculate analytics
-        total_feedback = len(feedbacks)
+        # Let the database reduce every feedback row to a handful of scalars
+        averages = ",\n                ".join(
+            f"AVG(NULLIF({column}_value, 0)) AS {key}" for key, column in FEEDBACK_RATING_FIELDS.items()
+        )
+        totals = frappe.db.sql(f"""
+            SELECT COUNT(*) AS total_feedback,
+                {averages},
+                COUNT({overall}) AS rated_feedback,
+                COALESCE(SUM({overall} >= 4), 0) AS satisfied_customers,
+                COALESCE(SUM({overall} <= 2), 0) AS detractors,
+                COALESCE(SUM(would_recommend = 'Yes'), 0) AS recommend_yes
+            FROM `tabRestaurant Customer Feedback`
+            WHERE visit_date BETWEEN %(date_from)s AND %(date_to)s
+        """, values, as_dict=True)[0]
+        
+        feedback_by_type = dict(frappe.db.sql("""
+            SELECT feedback_type, COUNT(*)
+            FROM `tabRestaurant Customer Feedback`
+            WHERE visit_date BETWEEN %(date_from)s AND %(date_to)s
+            GROUP BY feedback_type
+        """, values))
+        
+        total_feedback = cint(totals.total_feedback)
+        rated_feedback = cint(totals.rated_feedback)
         
         # Average ratings
-        ratings = {
-            "overall": calculate_average_rating([f.overall_rating for f in feedbacks]),
-            "food_quality": calculate_average_rating([f.food_quality_rating for f in feedbacks if f.food_quality_rating]),
-            "service": calculate_average_rating([f.service_rating for f in feedbacks if f.service_rating]),
-            "ambiance": calculate_average_rating([f.ambiance_rating for f in feedbacks if f.ambiance_rating]),
-            "value": calculate_average_rating([f.value_rating for f in feedbacks if f.value_rating]),
-            "speed": calculate_average_rating([f.speed_rating for f in feedbacks if f.speed_rating])
-        }
+        ratings = {key: round(flt(totals[key]), 1) for key in FEEDBACK_RATING_FIELDS}
         
         # Satisfaction metrics
-        satisfied_customers = len([f for f in feedbacks if int(f.overall_rating.split()[0]) >= 4])
+        satisfied_customers = cint(totals.satisfied_customers)
         satisfaction_rate = (satisfied_customers / total_feedback * 100) if total_feedback > 0 else 0
         
-        # Recommendation metrics  
-        recommend_yes = len([f for f in feedbacks if f.would_recommend == "Yes"])
-        nps_score = calculate_nps_score(feedbacks)
-        
-        # Feedback trends
-        feedback_by_type = {}
-        for feedback in feedbacks:
-            fb_type = feedback.feedback_type
-            if fb_type not in feedback_by_type:
-                feedback_by_type[fb_type] = 0
-            feedback_by_type[fb_type] += 1
+        # Recommendation metrics (promoters are the satisfied 4-5 star ratings)
+        recommend_yes = cint(totals.recommend_yes)
+        nps_score = round((satisfied_customers - cint(totals.detractors)) / rated_feedback * 100, 1) if rated_feedback else 0
         
-        return {
+        result = {
             "success": True,
             "data": {
                 "summary": {
@@ -3588,14 +4156,21 @@ def get_feedback_analytics(date_from=None, date_to=None):
             }
         }
         
+        frappe.cache().set_value(cache_key, result, expires_in_sec=120)
+        return result
+        
     except Exception as e:
         return {
             "success": False,
             "message": f"Error getting feedback analytics: {str(e)}"
         }
 
+def clear_feedback_analytics_cache():
+    """Invalidate every cached feedback analytics range after feedback changes"""
+    frappe.cache().delete_keys("feedback_analytics:")
+
 def calculate_average_rating(ratings):
-    """Calculate average rating from string ratings"""
+    """Calculate average rating from numeric rating values, skipping unrated (0) entries"""
     if not ratings:
         return 0
     
@@ -3604,137 +4179,70 @@ def calculate_average_rating(ratings):
     
     for rating in ratings:
         if rating:
-            # Extract number from "4 - Very Good" format
-            rating_value = int(rating.split()[0])
-            total += rating_value
+            total += rating
             count += 1
     
     return round(total / count, 1) if count > 0 else 0
 
-def calculate_nps_score(feedbacks):
-    """Calculate Net Promoter Score"""
-    ratings = []
-    for feedback in feedbacks:
-        if feedback.overall_rating:
-            rating = int(feedback.overall_rating.split()[0])
-            ratings.append(rating)
-    
-    if not ratings:
-        return 0
-    
-    promoters = len([r for r in ratings if r >= 4])  # 4-5 stars
-    detractors = len([r for r in ratings if r <= 2])  # 1-2 stars
-    
-    nps = ((promoters - detractors) / len(ratings)) * 100
-    return round(nps, 1)
-
 # ============================================================================
 # HELPER FUNCTIONS FOR ALL SYSTEMS
 # ============================================================================
 
+def parse_json_data(data):
+    """Decode a JSON request payload with orjson, passing through already-parsed data"""
+    return orjson.loads(data) if isinstance(data, (str, bytes)) else data
+
+def generate_record_id(prefix, date_part=None):
+    """Generate a PREFIX-YYYYMMDD-XXXXXXXX ID; pass date_part to reuse one date across a batch"""
+    return f"{prefix}-{date_part or nowdate().replace('-', '')}-{secrets.token_hex(4).upper()}"
+
+def generate_sortable_id(prefix):
+    """Generate a time-ordered unique ID (uuid7-style millisecond timestamp + random bits)"""
+    return f"{prefix}-{time.time_ns() // 1000000:012X}{secrets.token_hex(3).upper()}"
+
 def generate_referral_code(customer_id):
     """Generate unique referral code for customer"""
     return f"REF{customer_id[-4:].upper()}{frappe.utils.random_string(4).upper()}"
 
 def get_bonus_points(reason):
     """Get bonus points based on reason"""
-    bonus_points = {
-        "birthday": 100,
-        "anniversary": 150,
-        "referral": 200,
-        "review": 50,
-        "social_share": 25,
-        "first_visit": 100,
-        "large_order": 50
-    }
-    return bonus_points.get(reason, 0)
+    return BONUS_POINTS.get(reason, 0)
 
 def get_tier_upgrade_reward(tier):
     """Get bonus points for tier upgrade"""
-    upgrade_rewards = {
-        "Silver": 100,
-        "Gold": 250,
-        "Platinum": 500,
-        "VIP": 1000,
-        "Founder": 2500
-    }
-    return upgrade_rewards.get(tier, 0)
+    return TIER_UPGRADE_REWARDS.get(tier, 0)
 
 def get_next_tier(current_tier):
     """Get next tier in progression"""
-    tier_progression = {
-        "Bronze": "Silver",
-        "Silver": "Gold", 
-        "Gold": "Platinum",
-        "Platinum": "VIP",
-        "VIP": "Founder",
-        "Founder": "Founder"  # Max tier
-    }
-    return tier_progression.get(current_tier, "Bronze")
+    return TIER_PROGRESSION.get(current_tier, "Bronze")
 
 def calculate_points_to_next_tier(loyalty):
     """Calculate points needed for next tier"""
-    tier_thresholds = {
-        "Bronze": 500,
-        "Silver": 1500,
-        "Gold": 5000,
-        "Platinum": 15000,
-        "VIP": 50000,
-        "Founder": 0  # Max tier
-    }
-    
-    current_tier = loyalty.current_tier
-    next_tier = get_next_tier(current_tier)
-    
-    if next_tier == current_tier:  # Already at max tier
+    next_threshold = NEXT_TIER_MIN_POINTS.get(loyalty.current_tier)
+    if next_threshold is None:  # Already at max tier
         return 0
     
-    next_threshold = tier_thresholds.get(next_tier, 0)
     return max(0, next_threshold - loyalty.lifetime_points)
 
 def calculate_redemption_value(redemption_type, points):
     """Calculate redemption value based on type and points"""
-    redemption_rates = {
-        "discount": 0.01,  # $0.01 per point
-        "free_appetizer": 500,  # 500 points = free appetizer
-        "free_dessert": 300,   # 300 points = free dessert
-        "free_drink": 200,     # 200 points = free drink
-        "percentage_off": 0.005  # $0.005 per point (5% off per 1000 points)
-    }
-    
     if redemption_type in ["free_appetizer", "free_dessert", "free_drink"]:
         return redemption_type.replace("_", " ").title()
     else:
-        rate = redemption_rates.get(redemption_type, 0.01)
+        rate = REDEMPTION_RATES.get(redemption_type, 0.01)
         return points * rate
 
-def is_time_conflict(time1, duration1, time2, duration2):
-    """Check if two time periods conflict"""
-    try:
-        # Convert times to minutes for easier calculation
-        start1 = time_to_minutes(time1)
-        end1 = start1 + (duration1 * 60)
-        
-        start2 = time_to_minutes(time2)
-        end2 = start2 + (duration2 * 60)
-        
-        # Check for overlap
-        return not (end1 <= start2 or end2 <= start1)
-        
-    except:
-        return False
-
 def time_to_minutes(time_str):
     """Convert time string to minutes since midnight"""
-    try:
-        if isinstance(time_str, str):
-            parts = time_str.split(":")
-            hours = int(parts[0])
-            minutes = int(parts[1])
-            return hours * 60 + minutes
-        return 0
-    except:
-        return 0
+    if isinstance(time_str, timedelta):
+        # Time fields are returned as timedelta by the database driver
+        return int(time_str.total_seconds()) // 60
+    if isinstance(time_str, str):
+        parts = time_str.split(":")
+        hours = int(parts[0])
+        minutes = int(parts[1])
+        return hours * 60 + minutes
+    return 0
 
 def suggest_alternative_times(event_date, duration_hours, room_preference):
     """Suggest alternative times for event booking"""
@@ -3753,8 +4261,10 @@ def check_staff_availability(event_date, event_time, duration_hours):
     # For now, assume staff is available
     return True
 
-def send_event_confirmation_email(event):
+def send_event_confirmation_email(event_id):
     """Send confirmation email for event booking"""
+    event = frappe.get_doc("Restaurant Event Booking", event_id)
+    
     # This would integrate with email system
     frappe.log_error(f"Event confirmation email sent for {event.event_id}", "Event Booking")
 
@@ -3817,18 +4327,35 @@ def process_order_completion(order_id):
             "message": f"Error processing order completion: {str(e)}"
         }
 
+CUSTOMER_360_FIELDS = [
+    "customer_id", "full_name", "email", "phone", "membership_tier",
+    "customer_since", "total_visits", "vip_status"
+]
+
 @frappe.whitelist(allow_guest=True)
 def get_customer_360_view(customer_id):
     """Get complete 360-degree view of customer"""
     try:
-        # Customer profile
-        customer = frappe.get_doc("Restaurant Customer Profile", customer_id)
+        # Customer profile, only the columns the view returns
+        customer = frappe.db.get_value("Restaurant Customer Profile", customer_id, CUSTOMER_360_FIELDS, as_dict=True)
+        if not customer:
+            return {
+                "success": False,
+                "message": f"Customer {customer_id} not found"
+            }
         
-        # Loyalty information
-        try:
-            loyalty = frappe.get_doc("Restaurant Loyalty Program", customer_id)
-        except:
-            loyalty = None
+        # Loyalty information, only the columns the view returns
+        loyalty = frappe.db.get_value("Restaurant Loyalty Program", customer_id,
+            ["current_points", "lifetime_points", "current_tier", "referral_code"], as_dict=True)
+        
+        # Lifetime order totals, aggregated in the database
+        order_stats = frappe.db.sql("""
+            SELECT COALESCE(SUM(total_amount), 0) AS total_spent,
+                COALESCE(AVG(total_amount), 0) AS average_order_value,
+                COUNT(*) AS order_count
+            FROM `tabRestaurant Order`
+            WHERE customer_id = %s
+        """, (customer_id,), as_dict=True)[0]
         
         # Recent orders
         recent_orders = frappe.get_all("Restaurant Order",
@@ -3841,10 +4368,11 @@ def get_customer_360_view(customer_id):
         # Feedback history
         feedback_history = frappe.get_all("Restaurant Customer Feedback",
             filters={"customer_id": customer_id},
-            fields=["feedback_id", "visit_date", "overall_rating", "feedback_type"],
+            fields=["feedback_id", "visit_date", "overall_rating", "overall_rating_value", "feedback_type"],
             order_by="visit_date desc",
             limit=5
         )
+        feedback_count = frappe.db.count("Restaurant Customer Feedback", {"customer_id": customer_id})
         
         # Complimentary items received
         complimentary_items = frappe.get_all("Restaurant Complimentary Item",
@@ -3855,23 +4383,13 @@ def get_customer_360_view(customer_id):
         )
         
         # Calculate customer metrics
-        total_spent = sum([order.total_amount for order in recent_orders])
-        avg_order_value = total_spent / len(recent_orders) if recent_orders else 0
-        avg_rating = calculate_average_rating([f.overall_rating for f in feedback_history])
+        total_spent = flt(order_stats.total_spent)
+        avg_rating = calculate_average_rating([f.overall_rating_value for f in feedback_history])
         
         return {
             "success": True,
             "data": {
-                "customer_profile": {
-                    "customer_id": customer.customer_id,
-                    "full_name": customer.full_name,
-                    "email": customer.email,
-                    "phone": customer.phone,
-                    "membership_tier": customer.membership_tier,
-                    "customer_since": customer.customer_since,
-                    "total_visits": customer.total_visits,
-                    "vip_status": customer.vip_status
-                },
+                "customer_profile": customer,
                 "loyalty_info": {
                     "current_points": loyalty.current_points if loyalty else 0,
                     "lifetime_points": loyalty.lifetime_points if loyalty else 0,
@@ -3881,16 +4399,17 @@ def get_customer_360_view(customer_id):
                 "order_history": {
                     "recent_orders": recent_orders,
                     "total_spent": total_spent,
-                    "average_order_value": round(avg_order_value, 2)
+                    "average_order_value": round(flt(order_stats.average_order_value), 2),
+                    "total_orders": order_stats.order_count
                 },
                 "feedback_summary": {
                     "recent_feedback": feedback_history,
                     "average_rating": avg_rating,
-                    "total_feedback_count": len(feedback_history)
+                    "total_feedback_count": feedback_count
                 },
                 "complimentary_history": complimentary_items,
                 "insights": {
-                    "customer_value": calculate_customer_value_score(customer, loyalty, recent_orders),
+                    "customer_value": calculate_customer_value_score(customer, loyalty, total_spent),
                     "satisfaction_level": get_satisfaction_level(avg_rating),
                     "engagement_level": calculate_engagement_level(customer, recent_orders, feedback_history)
                 }
@@ -3903,26 +4422,15 @@ def get_customer_360_view(customer_id):
             "message": f"Error getting customer 360 view: {str(e)}"
         }
 
-def calculate_customer_value_score(customer, loyalty, orders):
+def calculate_customer_value_score(customer, loyalty, total_spent):
     """Calculate customer value score"""
-    # Simple scoring algorithm
-    score = 0
-    
-    # Spending score (40%)
-    total_spent = sum([order.total_amount for order in orders])
-    spending_score = min(total_spent / 100, 40)  # Max 40 points for $4000+ spent
-    score += spending_score
-    
-    # Loyalty score (30%)
-    if loyalty:
-        loyalty_score = min(loyalty.lifetime_points / 100, 30)  # Max 30 points for 3000+ points
-        score += loyalty_score
-    
-    # Frequency score (30%)
-    frequency_score = min(customer.total_visits * 2, 30)  # Max 30 points for 15+ visits
-    score += frequency_score
-    
-    return round(score, 1)
+    # Spending (40%), loyalty (30%) and visit frequency (30%), each capped at its share
+    return round(
+        min(total_spent / 100, 40)  # Max 40 points for $4000+ spent
+        + min((loyalty.lifetime_points if loyalty else 0) / 100, 30)  # Max 30 points for 3000+ points
+        + min(customer.total_visits * 2, 30),  # Max 30 points for 15+ visits
+        1
+    )
 
 def get_satisfaction_level(avg_rating):
     """Get satisfaction level from average rating"""
@@ -4064,10 +4572,7 @@ def calculate_kitchen_time(order):
     total_minutes = base_time + additional_time + complexity_time
     
     # Calculate estimated completion time
-    completion_time = frappe.utils.add_to_date(
-        frappe.utils.now(), 
-        minutes=total_minutes
-    )
+    completion_time = now_datetime() + timedelta(minutes=total_minutes)
     
     return completion_time
 
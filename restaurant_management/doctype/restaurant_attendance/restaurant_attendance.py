@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantAttendance(Document):
+    pass
+
+def on_doctype_update():
+    """Add composite index for per-staff attendance lookups by date"""
+    frappe.db.add_index("Restaurant Attendance", ["staff_id", "date", "status"])
@@ -0,0 +1,13 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantComplimentaryItem(Document):
+    pass
+
+def on_doctype_update():
+    """Add indexes for complimentary history lookups by customer and by date range"""
+    # Covers the per-customer history analytics without touching the table rows
+    frappe.db.add_index("Restaurant Complimentary Item",
+        ["customer_id", "date_given", "trigger_type", "cost_center", "original_price", "quantity"],
+        index_name="customer_date_covering_index")
+    frappe.db.add_index("Restaurant Complimentary Item", ["date_given"])
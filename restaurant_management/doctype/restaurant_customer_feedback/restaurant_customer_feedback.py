@@ -0,0 +1,46 @@
+import frappe
+from frappe.model.document import Document
+from restaurant_management.api import (FEEDBACK_RATING_FIELDS, HIGH_PRIORITY_FEEDBACK_TYPES,
+    MEDIUM_PRIORITY_FEEDBACK_TYPES, parse_rating, clear_feedback_analytics_cache)
+
+class RestaurantCustomerFeedback(Document):
+    
+    def validate(self):
+        """Keep the numeric rating columns in step with the rating labels"""
+        for column in FEEDBACK_RATING_FIELDS.values():
+            self.set(f"{column}_value", parse_rating(self.get(column)))
+    
+    def on_update(self):
+        """Drop cached analytics so dashboards pick up the change"""
+        clear_feedback_analytics_cache()
+    
+    def on_trash(self):
+        """Drop cached analytics so dashboards stop counting removed feedback"""
+        clear_feedback_analytics_cache()
+
+def on_doctype_update():
+    """Backfill numeric rating columns, add the generated priority column and index feedback lookups"""
+    frappe.db.add_index("Restaurant Customer Feedback", ["customer_id", "visit_date"])
+    
+    for column in FEEDBACK_RATING_FIELDS.values():
+        frappe.db.sql(f"""
+            UPDATE `tabRestaurant Customer Feedback`
+            SET {column}_value = CAST(SUBSTRING_INDEX({column}, ' ', 1) AS UNSIGNED)
+            WHERE {column}_value = 0 AND COALESCE({column}, '') != ''
+        """)
+    
+    # Mirror determine_feedback_priority in the database so dashboards can filter by priority on an index
+    if not frappe.db.has_column("Restaurant Customer Feedback", "priority_gen"):
+        high_types = ", ".join(frappe.db.escape(t) for t in sorted(HIGH_PRIORITY_FEEDBACK_TYPES))
+        medium_types = ", ".join(frappe.db.escape(t) for t in sorted(MEDIUM_PRIORITY_FEEDBACK_TYPES))
+        frappe.db.sql_ddl(f"""
+            ALTER TABLE `tabRestaurant Customer Feedback`
+            ADD COLUMN `priority_gen` VARCHAR(10) GENERATED ALWAYS AS (
+                CASE
+                    WHEN overall_rating_value <= 2 OR feedback_type IN ({high_types}) THEN 'High'
+                    WHEN CHAR_LENGTH(COALESCE(negative_comments, '')) > 50 OR feedback_type IN ({medium_types}) THEN 'Medium'
+                    ELSE 'Low'
+                END
+            ) STORED
+        """)
+    frappe.db.add_index("Restaurant Customer Feedback", ["priority_gen", "visit_date"])
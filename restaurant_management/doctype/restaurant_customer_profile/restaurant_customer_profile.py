@@ -0,0 +1,23 @@
+import frappe
+from frappe.model.document import Document
+from restaurant_management.api import clear_customer_occasion_cache, CUSTOMER_OCCASION_FIELDS
+
+class RestaurantCustomerProfile(Document):
+    
+    def on_update(self):
+        """Refresh today's birthday and anniversary lookups after a change"""
+        clear_customer_occasion_cache()
+    
+    def on_trash(self):
+        """Refresh today's birthday and anniversary lookups after a profile is removed"""
+        clear_customer_occasion_cache()
+
+def on_doctype_update():
+    """Add indexed MMDD columns so birthday and anniversary lookups avoid date math on every row"""
+    for date_field, column in CUSTOMER_OCCASION_FIELDS.items():
+        if not frappe.db.has_column("Restaurant Customer Profile", column):
+            frappe.db.sql_ddl(f"""
+                ALTER TABLE `tabRestaurant Customer Profile`
+                ADD COLUMN `{column}` CHAR(4) GENERATED ALWAYS AS (DATE_FORMAT(`{date_field}`, '%m%d')) STORED
+            """)
+        frappe.db.add_index("Restaurant Customer Profile", [column])
@@ -1,6 +1,7 @@
 import frappe
 from frappe.model.document import Document
 from frappe.utils import nowdate, getdate
+from restaurant_management.api import clear_menu_item_price_cache
 import json
 
 class RestaurantMenuItem(Document):
@@ -74,6 +75,18 @@ class RestaurantMenuItem(Document):
     def on_update(self):
         """Actions after menu item is updated"""
         self.update_availability()
+        self.clear_price_cache()
+    
+    def on_trash(self):
+        """Drop the cached price for a deleted menu item"""
+        clear_menu_item_price_cache(self.item_name)
+    
+    def clear_price_cache(self):
+        """Invalidate cached prices under the current and any previous item name"""
+        clear_menu_item_price_cache(self.item_name)
+        previous = self.get_doc_before_save()
+        if previous and previous.item_name != self.item_name:
+            clear_menu_item_price_cache(previous.item_name)
     
     def update_availability(self):
         """Update availability status"""
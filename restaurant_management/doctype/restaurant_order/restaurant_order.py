@@ -162,6 +162,10 @@ class RestaurantOrder(Document):
             "item_count": len(self.items)
         }
 
+def on_doctype_update():
+    """Add index for a customer's orders newest first"""
+    frappe.db.add_index("Restaurant Order", ["customer_id", "order_date"])
+
 @frappe.whitelist()
 def create_order(order_data):
     """Create a new restaurant order"""
@@ -174,6 +178,7 @@ def create_order(order_data):
             "order_type": data.get("order_type", "Dine In"),
             "table_number": data.get("table_number"),
             "waiter": data.get("waiter"),
+            "customer_id": data.get("customer_id"),
             "customer_name": data.get("customer_name"),
             "customer_phone": data.get("customer_phone"),
             "customer_email": data.get("customer_email"),
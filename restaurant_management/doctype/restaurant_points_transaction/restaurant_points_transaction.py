@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantPointsTransaction(Document):
+    pass
+
+def on_doctype_update():
+    """Add composite index for per-customer points history lookups"""
+    frappe.db.add_index("Restaurant Points Transaction", ["customer_id", "transaction_time"])
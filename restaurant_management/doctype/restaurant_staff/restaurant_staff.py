@@ -1,6 +1,8 @@
 import frappe
 from frappe.model.document import Document
 from frappe.utils import nowdate, getdate
+from restaurant_management.api import (clear_staff_payroll_cache, clear_login_staff_cache,
+    calculate_attendance_hours, build_payroll_item, hash_face_encoding)
 import json
 
 class RestaurantStaff(Document):
@@ -11,6 +13,7 @@ class RestaurantStaff(Document):
         self.validate_phone()
         self.calculate_overtime_rate()
         self.validate_hire_date()
+        self.face_encoding_hash = hash_face_encoding(self.face_encoding)
     
     def validate_email(self):
         """Validate email format and uniqueness"""
@@ -40,6 +43,20 @@ class RestaurantStaff(Document):
         """Actions after staff is updated"""
         self.update_face_recognition_status()
         self.create_user_account()
+        clear_staff_payroll_cache(self.name)
+        self.clear_login_cache()
+    
+    def on_trash(self):
+        """Drop cached payroll and login data for a deleted staff member"""
+        clear_staff_payroll_cache(self.name)
+        clear_login_staff_cache(self.email)
+    
+    def clear_login_cache(self):
+        """Invalidate cached login rows under the current and any previous email"""
+        clear_login_staff_cache(self.email)
+        previous = self.get_doc_before_save()
+        if previous and previous.email != self.email:
+            clear_login_staff_cache(previous.email)
     
     def update_face_recognition_status(self):
         """Update face recognition status based on face encoding"""
@@ -82,11 +99,13 @@ class RestaurantStaff(Document):
     
     def get_attendance_records(self, start_date=None, end_date=None):
         """Get attendance records for this staff member"""
-        filters = {"name": self.name}
+        filters = {"staff_id": self.name}
         
-        if start_date:
+        if start_date and end_date:
+            filters["date"] = ["between", [start_date, end_date]]
+        elif start_date:
             filters["date"] = [">=", start_date]
-        if end_date:
+        elif end_date:
             filters["date"] = ["<=", end_date]
         
         return frappe.get_all("Restaurant Attendance", 
@@ -96,43 +115,31 @@ class RestaurantStaff(Document):
     
     def calculate_hours_worked(self, start_date=None, end_date=None):
         """Calculate total hours worked in a period"""
-        attendance_records = self.get_attendance_records(start_date, end_date)
-        total_hours = 0
-        
-        for record in attendance_records:
-            if record.check_in_time and record.check_out_time:
-                # Calculate hours between check-in and check-out
-                check_in = frappe.utils.get_datetime(record.check_in_time)
-                check_out = frappe.utils.get_datetime(record.check_out_time)
-                hours = (check_out - check_in).total_seconds() / 3600
-                total_hours += hours
-        
-        return round(total_hours, 2)
+        return calculate_attendance_hours(self.get_attendance_records(start_date, end_date))
     
     def calculate_payroll(self, start_date, end_date):
         """Calculate payroll for a specific period"""
-        total_hours = self.calculate_hours_worked(start_date, end_date)
-        
-        # Basic calculation - can be enhanced with overtime, weekend rates, etc.
-        base_pay = total_hours * self.base_hourly_rate
-        
-        return {
-            "staff_id": self.name,
-            "staff_name": self.full_name,
-            "period": f"{start_date} to {end_date}",
-            "total_hours": total_hours,
-            "base_rate": self.base_hourly_rate,
-            "base_pay": base_pay,
-            "overtime_hours": 0,  # To be implemented
-            "overtime_pay": 0,    # To be implemented
-            "total_pay": base_pay
-        }
+        return build_payroll_item(self, self.calculate_hours_worked(start_date, end_date), start_date, end_date)
+
+def on_doctype_update():
+    """Add indexes for login and staff lookups, and backfill face encoding hashes"""
+    # Login and password reset look staff up by email among active accounts
+    frappe.db.add_index("Restaurant Staff", ["email", "employment_status"])
+    frappe.db.add_index("Restaurant Staff", ["employment_status"])
+    frappe.db.add_index("Restaurant Staff", ["face_encoding_hash"])
+    
+    # Faces registered before face_encoding_hash existed
+    frappe.db.sql("""
+        UPDATE `tabRestaurant Staff`
+        SET face_encoding_hash = SHA2(face_encoding, 256)
+        WHERE COALESCE(face_encoding_hash, '') = '' AND COALESCE(face_encoding, '') != ''
+    """)
 
 @frappe.whitelist()
 def get_staff_by_face_encoding(face_encoding):
     """Get staff member by face encoding"""
     staff = frappe.get_all("Restaurant Staff", 
-        filters={"face_encoding": face_encoding, "employment_status": "Active"},
+        filters={"face_encoding_hash": hash_face_encoding(face_encoding), "employment_status": "Active"},
         fields=["name", "full_name", "position"])
     
     if staff:
@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantStaffAdvance(Document):
+    pass
+
+def on_doctype_update():
+    """Add composite index for per-staff outstanding advance lookups"""
+    frappe.db.add_index("Restaurant Staff Advance", ["staff_id", "status"])
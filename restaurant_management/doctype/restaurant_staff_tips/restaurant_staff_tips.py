@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantStaffTips(Document):
+    pass
+
+def on_doctype_update():
+    """Add composite index for per-staff tip lookups by date"""
+    frappe.db.add_index("Restaurant Staff Tips", ["staff_id", "tip_date"])
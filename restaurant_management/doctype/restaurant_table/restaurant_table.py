@@ -0,0 +1,12 @@
+from frappe.model.document import Document
+from restaurant_management.api import clear_restaurant_tables_cache
+
+class RestaurantTable(Document):
+    
+    def on_update(self):
+        """Reload the cached table layout after a change"""
+        clear_restaurant_tables_cache()
+    
+    def on_trash(self):
+        """Reload the cached table layout after a table is removed"""
+        clear_restaurant_tables_cache()
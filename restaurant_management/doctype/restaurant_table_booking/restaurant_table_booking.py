@@ -0,0 +1,26 @@
+import frappe
+from frappe.model.document import Document
+from restaurant_management.api import clear_table_booking_cache
+
+class RestaurantTableBooking(Document):
+    
+    def on_update(self):
+        """Invalidate cached availability for the affected dates"""
+        self.clear_booking_cache()
+        
+        previous = self.get_doc_before_save()
+        if previous and previous.booking_date != self.booking_date:
+            clear_table_booking_cache(previous.booking_date)
+    
+    def on_trash(self):
+        """Invalidate cached availability when a booking is deleted"""
+        self.clear_booking_cache()
+    
+    def clear_booking_cache(self):
+        """Clear cached bookings for this booking's date"""
+        clear_table_booking_cache(self.booking_date)
+
+def on_doctype_update():
+    """Add composite indexes for the availability and listing lookups"""
+    frappe.db.add_index("Restaurant Table Booking", ["booking_date", "booking_status"])
+    frappe.db.add_index("Restaurant Table Booking", ["booking_date", "booking_time", "booking_id"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+class RestaurantWaitlist(Document):
+    pass
+
+def on_doctype_update():
+    """Add composite index for the waitlist position lookup"""
+    frappe.db.add_index("Restaurant Waitlist",
+        ["requested_date", "requested_time", "waitlist_status", "added_time"])